@@ -0,0 +1,144 @@
+#!fontforge --lang=py -script
+
+# copy_altuni のエンコーディング整理について、
+# 現在のディスク経由の開き直しと、候補であるメモリ上での作り直しの処理時間をスタイル毎に比較する
+# 合わせて両者の cmap (altuni を含む)、グリフ毎の altuni、グリフの並び順を比較し、
+# 異なる場合は終了コード 1 で終了する
+# リポジトリのルートで実行すること
+
+import os
+import sys
+import time
+
+import fontforge
+
+sys.path.insert(0, os.getcwd())
+
+import fontforge_script  # noqa: E402
+
+# 計測回数
+REPEAT = 3
+
+
+def main():
+    # copy_altuni は開き直しのための一時ファイルを BUILD_FONTS_DIR に書き出す
+    os.makedirs(fontforge_script.BUILD_FONTS_DIR, exist_ok=True)
+    failed = False
+    for style in ["Rg", "Bd"]:
+        path = (
+            f"{fontforge_script.SOURCE_FONTS_DIR}/"
+            f"{fontforge_script.SRC_FONT}{style}.ttf"
+        )
+        reopen = measure(path, fontforge_script.copy_altuni)
+        in_memory = measure(path, copy_altuni_in_memory)
+        print(
+            f"{style}: reopen {reopen:.3f}s, in-memory {in_memory:.3f}s, "
+            f"saved {reopen - in_memory:.3f}s per style"
+        )
+        differences = compare_encodings(path)
+        for difference in differences:
+            print(f"  {difference}")
+        if differences:
+            failed = True
+        else:
+            print("  cmap, altuni and glyph order are identical")
+    if failed:
+        sys.exit(1)
+
+
+def measure(path: str, func) -> float:
+    """フォントを開いて func を実行した時間の平均を返す (フォントを開く時間は除く)"""
+    elapsed = 0.0
+    for _ in range(REPEAT):
+        font = fontforge.open(path)
+        start = time.perf_counter()
+        font = func(font, (0x301C,))
+        elapsed += time.perf_counter() - start
+        font.close()
+    return elapsed / REPEAT
+
+
+def compare_encodings(path: str) -> list:
+    """現在の実装とメモリ上での作り直しの結果を比較し、差分の説明のリストを返す"""
+    font = fontforge_script.copy_altuni(fontforge.open(path), (0x301C,))
+    expected = get_encoding_summary(font)
+    font.close()
+    font = copy_altuni_in_memory(fontforge.open(path), (0x301C,))
+    actual = get_encoding_summary(font)
+    font.close()
+
+    differences = []
+    for name in ["cmap", "altuni", "glyph order"]:
+        if expected[name] == actual[name]:
+            continue
+        if isinstance(expected[name], dict):
+            keys = sorted(
+                key
+                for key in expected[name].keys() | actual[name].keys()
+                if expected[name].get(key) != actual[name].get(key)
+            )
+            samples = ", ".join(
+                f"{key}: {expected[name].get(key)} -> {actual[name].get(key)}"
+                for key in keys[:5]
+            )
+            differences.append(f"{name}: {len(keys)} entries differ ({samples})")
+        else:
+            differences.append(
+                f"{name}: differs ({len(expected[name])} -> {len(actual[name])} glyphs)"
+            )
+    return differences
+
+
+def get_encoding_summary(font) -> dict:
+    """出力されるグリフの cmap (altuni を含む)、グリフ毎の altuni、エンコーディング順の並びを返す"""
+    glyphs = [
+        glyph for glyph in font.glyphs("encoding") if glyph.isWorthOutputting()
+    ]
+    cmap = {}
+    altuni = {}
+    for glyph in glyphs:
+        for codepoint in fontforge_script.get_codepoints(glyph):
+            cmap[codepoint] = glyph.glyphname
+        if glyph.altuni is not None:
+            altuni[glyph.glyphname] = tuple(sorted(glyph.altuni))
+    return {
+        "cmap": cmap,
+        "altuni": altuni,
+        "glyph order": [glyph.glyphname for glyph in glyphs],
+    }
+
+
+def copy_altuni_in_memory(font, unicode_list):
+    """比較用: 開き直さずにグリフの unicode, altuni からエンコーディングを作り直す実装"""
+    for unicode in unicode_list:
+        glyph = font[unicode]
+        if glyph.altuni is not None:
+            altunis = glyph.altuni
+            before_altuni = ""
+            for altuni in altunis:
+                if altuni[1] == -1 and before_altuni != ",".join(map(str, altuni)):
+                    glyph.altuni = None
+                    copy_target_unicode = altuni[0]
+                    try:
+                        copy_target_glyph = font.createChar(
+                            copy_target_unicode,
+                            f"uni{hex(copy_target_unicode).replace('0x', '').upper()}copy",
+                        )
+                    except Exception:
+                        copy_target_glyph = font[copy_target_unicode]
+                    copy_target_glyph.clear()
+                    copy_target_glyph.width = glyph.width
+                    font.selection.select(glyph.glyphname)
+                    font.copy()
+                    font.selection.select(copy_target_glyph.glyphname)
+                    font.paste()
+                before_altuni = ",".join(map(str, altuni))
+    encoding = font.encoding
+    # 同じエンコーディングを設定しても作り直されないため、一度 compacted を経由する
+    font.encoding = "compacted"
+    font.encoding = encoding
+    return font
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/bin/env python3
+
+# 各バリエーションのビルド全体と各処理の処理時間を計測し、基準値からの劣化を検出する
+# リポジトリのルートで実行すること
+
+import configparser
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+import stage_profiler  # noqa: E402
+
+# iniファイルを読み込む
+settings = configparser.ConfigParser()
+settings.read("build.ini", encoding="utf-8")
+
+BUILD_FONTS_DIR = settings.get("DEFAULT", "BUILD_FONTS_DIR")
+# build.py --stage-report の計測結果の出力先
+STAGE_REPORT_DIR = f"{BUILD_FONTS_DIR}/stage_report"
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+# 計測結果の履歴 (1行1回分の JSON)
+HISTORY = f"{BENCHMARKS_DIR}/history.jsonl"
+# 比較の基準とする計測結果
+BASELINE = f"{BENCHMARKS_DIR}/baseline.json"
+
+DEFAULT_VARIANTS = ["default", "HW", "NF", "HWNF", "SZ", "IS"]
+# 基準値に対して何割遅くなったら失敗とするか
+DEFAULT_THRESHOLD = 0.2
+# 計測のばらつきを無視するため、これより短い増加は失敗としない (秒)
+MIN_SLOWDOWN_SECONDS = 0.5
+
+options = {}
+
+
+def main():
+    # オプション判定
+    get_options()
+    if options.get("unknown-option"):
+        usage()
+        return
+
+    result = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "variants": {},
+    }
+    for variant in options.get("variants", DEFAULT_VARIANTS):
+        result["variants"][variant] = run_variant(variant)
+
+    # 履歴に追記する
+    with open(HISTORY, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, sort_keys=True) + "\n")
+
+    if options.get("update-baseline") or not os.path.exists(BASELINE):
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f"Baseline updated: {BASELINE}")
+        return
+
+    with open(BASELINE, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    threshold = options.get("threshold", DEFAULT_THRESHOLD)
+    regressions = compare(baseline, result, threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+def usage():
+    print(
+        f"Usage: {sys.argv[0]} [--variants {','.join(DEFAULT_VARIANTS)}]"
+        f" [--threshold {DEFAULT_THRESHOLD}] [--jobs N] [--cache]"
+        " [--update-baseline]"
+    )
+
+
+def get_options():
+    """オプションを取得する"""
+
+    global options
+
+    args = iter(sys.argv[1:])
+    for arg in args:
+        # オプション判定
+        if arg == "--variants":
+            # 計測するバリエーションをカンマ区切りで指定する
+            options["variants"] = [v for v in next(args, "").split(",") if v]
+        elif arg == "--threshold":
+            # 基準値に対して許容する劣化の割合
+            try:
+                options["threshold"] = float(next(args, ""))
+            except ValueError:
+                options["unknown-option"] = True
+                return
+        elif arg == "--jobs":
+            # build.py のワーカープロセス数
+            jobs = next(args, "")
+            if not jobs.isdecimal() or int(jobs) < 1:
+                options["unknown-option"] = True
+                return
+            options["jobs"] = jobs
+        elif arg == "--cache":
+            # 合成前の共通処理等のキャッシュを使用した状態で計測する
+            options["cache"] = True
+        elif arg == "--update-baseline":
+            # 今回の計測結果を基準値として保存する
+            options["update-baseline"] = True
+        else:
+            options["unknown-option"] = True
+            return
+
+
+def run_variant(variant: str) -> dict:
+    """1バリエーション分のビルドを実行し、全体と各処理の処理時間を返す"""
+    print(f"=== Benchmark {variant} ===")
+    command = [
+        sys.executable,
+        "build.py",
+        "--variants",
+        variant,
+        "--force",
+        "--stage-report",
+    ]
+    if not options.get("cache"):
+        command.append("--no-cache")
+    if options.get("jobs"):
+        command += ["--jobs", options["jobs"]]
+
+    start_time = time.perf_counter()
+    subprocess.run(command, check=True)
+    total = time.perf_counter() - start_time
+
+    # 各処理の処理時間は全スタイルの合計とする
+    stages = {}
+    for report in stage_profiler.load_reports(STAGE_REPORT_DIR):
+        source = report["label"].rsplit(" (", 1)[-1].rstrip(")")
+        for index, record in enumerate(report["stages"]):
+            name = f"{source}:{'/'.join(get_stage_path(report['stages'], index))}"
+            stages[name] = round(stages.get(name, 0) + record["seconds"], 3)
+    return {"total": round(total, 3), "stages": stages}
+
+
+def get_stage_path(records: list, index: int) -> list:
+    """入れ子になったステージを親からの経路で表す"""
+    path = [records[index]["stage"]]
+    depth = records[index]["depth"]
+    for parent in reversed(records[:index]):
+        if parent["depth"] < depth:
+            path.insert(0, parent["stage"])
+            depth = parent["depth"]
+    return path
+
+
+def compare(baseline: dict, result: dict, threshold: float) -> list:
+    """基準値より threshold の割合以上遅くなった処理を返す"""
+    regressions = []
+    for variant, current in result["variants"].items():
+        base = baseline["variants"].get(variant)
+        if base is None:
+            continue
+        timings = [("total", base["total"], current["total"])] + [
+            (name, base["stages"][name], seconds)
+            for name, seconds in current["stages"].items()
+            if name in base["stages"]
+        ]
+        for name, base_seconds, seconds in timings:
+            if (
+                seconds > base_seconds * (1 + threshold)
+                and seconds - base_seconds > MIN_SLOWDOWN_SECONDS
+            ):
+                regressions.append(
+                    f"{variant} {name}: {base_seconds:.3f}s -> {seconds:.3f}s"
+                )
+    return regressions
+
+
+def get_commit() -> str:
+    """計測対象のコミットを返す"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,562 @@
+#!/bin/env python3
+
+# 複数のバリエーションを1回の実行でまとめてビルドする
+# fontforge モジュールを import できる Python で実行すること
+# (--engine fonttools の場合は FontForge は不要)
+
+import configparser
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import traceback
+
+import fontTools
+from fontTools.ttLib import woff2
+
+import coverage_profiles
+import font_settings
+import fonttools_merge
+import fonttools_script
+import stage_profiler
+
+try:
+    import fontforge
+    import fontforge_script
+except ImportError:
+    # FontForge がない環境では --engine fonttools のみ使える
+    fontforge = None
+    fontforge_script = None
+
+try:
+    import validate_fonts
+except ImportError:
+    # NumPy がない環境では --validate は使えない
+    validate_fonts = None
+
+# iniファイルを読み込む
+settings = configparser.ConfigParser()
+settings.read("build.ini", encoding="utf-8")
+
+FONT_NAME = settings.get("DEFAULT", "FONT_NAME")
+BUILD_FONTS_DIR = settings.get("DEFAULT", "BUILD_FONTS_DIR")
+FONTFORGE_PREFIX = settings.get("DEFAULT", "FONTFORGE_PREFIX")
+HALF_WIDTH_STR = settings.get("DEFAULT", "HALF_WIDTH_STR")
+SLASHED_ZERO_STR = settings.get("DEFAULT", "SLASHED_ZERO_STR")
+INVISIBLE_ZENKAKU_SPACE_STR = settings.get("DEFAULT", "INVISIBLE_ZENKAKU_SPACE_STR")
+NERD_FONTS_STR = settings.get("DEFAULT", "NERD_FONTS_STR")
+SRC_FONT = settings.get("DEFAULT", "SRC_FONT")
+DST_FONT = settings.get("DEFAULT", "DST_FONT")
+SOURCE_FONTS_DIR = settings.get("DEFAULT", "SOURCE_FONTS_DIR")
+IDEOGRAPHIC_SPACE = settings.get("DEFAULT", "IDEOGRAPHIC_SPACE")
+
+# 出力フォント毎の入力のハッシュを記録するファイル
+MANIFEST = f"{BUILD_FONTS_DIR}/manifest.json"
+# 出力結果に影響するスクリプト
+# build.py は合成処理のオプションを設定し、stage_profiler.py は各処理から呼ばれるため含める
+BUILD_SCRIPTS = (
+    "build.py",
+    "coverage_profiles.py",
+    "font_settings.py",
+    "fontforge_script.py",
+    "fonttools_merge.py",
+    "fonttools_script.py",
+    "stage_profiler.py",
+)
+# 変更されてもビルド済みフォントの書き換え (fonttools_script.py --restamp) で反映できる設定
+RESTAMP_KEYS = ("VERSION", "VENDER_NAME", "OS2_ASCENT", "OS2_DESCENT")
+# 各処理の計測結果の出力先
+STAGE_REPORT_DIR = fonttools_merge.STAGE_REPORT_DIR
+# 合成に使う処理 (fontforge: fontforge_script.py, fonttools: fonttools_merge.py)
+ENGINES = ("fontforge", "fonttools")
+
+# バリエーション指定の修飾子と fontforge_script.py のオプションの対応
+# 並び順は fontforge_script.get_variant() の修飾子の順序に合わせる
+VARIANT_OPTIONS = (
+    (HALF_WIDTH_STR, "half-width"),
+    (SLASHED_ZERO_STR, "slashed-zero"),
+    (INVISIBLE_ZENKAKU_SPACE_STR, "invisible-zenkaku-space"),
+    (NERD_FONTS_STR, "nerd-fonts"),
+)
+DEFAULT_VARIANT = "default"
+
+options = {}
+# 同じファイルを何度も読まないよう、ファイルのハッシュをキャッシュする
+file_hashes = {}
+
+
+def main():
+    # オプション判定
+    get_options()
+    if options.get("unknown-option"):
+        usage()
+        return
+
+    variants = [parse_variant(spec) for spec in options["variants"]]
+    if None in variants:
+        usage()
+        return
+    # 同じバリエーションを複数回指定した場合に、同じ出力先へ並列に書き込まないよう重複を除く
+    # (HWNF と NFHW のように表記が異なる場合も同じバリエーションとみなす)
+    variants = list({get_variant(v): v for v in variants}.values())
+    if options["engine"] == "fontforge" and fontforge_script is None:
+        print("Error: fontforge module is not available, use --engine fonttools")
+        sys.exit(1)
+    if options.get("web") and not woff2.haveBrotli:
+        print("Error: brotli module is not available, run pip install brotli")
+        sys.exit(1)
+    if options.get("validate") and validate_fonts is None:
+        print("Error: numpy module is not available, run pip install numpy")
+        sys.exit(1)
+
+    # 各バリエーションの出力先を作成する
+    # 削除するのは今回ビルドするバリエーションの出力先のみ
+    os.makedirs(BUILD_FONTS_DIR, exist_ok=True)
+    for variant_options in variants:
+        build_dir = get_build_dir(variant_options)
+        if options.get("force") and os.path.exists(build_dir):
+            shutil.rmtree(build_dir)
+        os.makedirs(build_dir, exist_ok=True)
+
+    manifest = {} if options.get("force") else load_manifest()
+
+    if options.get("stage-report") and os.path.exists(STAGE_REPORT_DIR):
+        shutil.rmtree(STAGE_REPORT_DIR)
+
+    with create_pool() as pool:
+        errors = build_variants(pool, variants, manifest)
+        if options.get("web"):
+            errors += build_web_fonts(pool, variants, manifest)
+        if options.get("validate"):
+            errors += validate_variants(pool, variants)
+
+    save_manifest(manifest)
+
+    if options.get("stage-report"):
+        stage_profiler.print_totals(stage_profiler.load_reports(STAGE_REPORT_DIR))
+
+    for error in errors:
+        print(f"Error: {error}")
+    if errors:
+        sys.exit(1)
+
+
+def usage():
+    print(
+        f"Usage: {sys.argv[0]} "
+        f"[--variants {DEFAULT_VARIANT},{HALF_WIDTH_STR},{NERD_FONTS_STR},"
+        f"{HALF_WIDTH_STR}{NERD_FONTS_STR}] [--jobs N] [--force] [--no-cache]"
+        f" [--stage-report] [--engine {'|'.join(ENGINES)}] [--stream]"
+        " [--dedup-outlines] [--web] [--validate]"
+        f" [--profile {'|'.join(coverage_profiles.get_profile_names())}]"
+    )
+
+
+def get_options():
+    """オプションを取得する"""
+
+    global options
+
+    options["variants"] = [DEFAULT_VARIANT]
+    options["engine"] = ENGINES[0]
+
+    args = iter(sys.argv[1:])
+    for arg in args:
+        # オプション判定
+        if arg == "--variants":
+            # ビルドするバリエーションをカンマ区切りで指定する
+            options["variants"] = [v for v in next(args, "").split(",") if v]
+            if len(options["variants"]) == 0:
+                options["unknown-option"] = True
+                return
+        elif arg == "--jobs":
+            # ワーカープロセス数
+            jobs = next(args, "")
+            if not jobs.isdecimal() or int(jobs) < 1:
+                options["unknown-option"] = True
+                return
+            options["jobs"] = int(jobs)
+        elif arg == "--force":
+            # 入力が変わっていないフォントも再生成する
+            options["force"] = True
+        elif arg == "--no-cache":
+            # 合成前の共通処理等のキャッシュを使用しない
+            options["no-cache"] = True
+        elif arg == "--stage-report":
+            # 各処理の処理時間・メモリ使用量・グリフ数を計測する
+            options["stage-report"] = True
+        elif arg == "--engine":
+            # 合成に使う処理
+            options["engine"] = next(args, "")
+            if options["engine"] not in ENGINES:
+                options["unknown-option"] = True
+                return
+        elif arg == "--stream":
+            # 合成結果を中間ファイルに書き出さず、メモリ上でテーブル編集に渡す
+            options["stream"] = True
+        elif arg == "--dedup-outlines":
+            # 同じ輪郭のグリフを複合グリフにしてファイルサイズを減らす
+            options["dedup-outlines"] = True
+        elif arg == "--web":
+            # WOFF2 と unicode-range 毎のサブセット、CSS も出力する
+            options["web"] = True
+        elif arg == "--validate":
+            # ビルドしたフォントの幅、メトリクス、cmap を検証する
+            options["validate"] = True
+        elif arg == "--profile":
+            # 合成するグリフをプロファイルのコードポイントに絞り込む (開発用)
+            options["profile"] = next(args, "")
+            if options["profile"] not in coverage_profiles.get_profile_names():
+                options["unknown-option"] = True
+                return
+        else:
+            options["unknown-option"] = True
+            return
+
+
+def parse_variant(spec: str):
+    """バリエーション指定 (例: HWNF) を fontforge_script.py のオプションに変換する"""
+    variant_options = {}
+    if spec == DEFAULT_VARIANT:
+        return variant_options
+    rest = spec
+    while rest:
+        for variant_str, option in VARIANT_OPTIONS:
+            if rest.startswith(variant_str) and option not in variant_options:
+                variant_options[option] = True
+                rest = rest[len(variant_str) :]
+                break
+        else:
+            print(f"Error: unknown variant {spec}")
+            return None
+    return variant_options
+
+
+def get_variant(variant_options: dict) -> str:
+    """オプションからフォント名の修飾子を返す"""
+    return "".join(
+        variant_str
+        for variant_str, option in VARIANT_OPTIONS
+        if variant_options.get(option)
+    )
+
+
+def get_build_dir(variant_options: dict) -> str:
+    """バリエーション毎の出力先ディレクトリを返す"""
+    return f"{BUILD_FONTS_DIR}/{FONT_NAME}{get_variant(variant_options)}"
+
+
+def get_output_path(variant_options: dict, merged_style: str) -> str:
+    """最終的に出力されるフォントのパスを返す"""
+    return (
+        f"{get_build_dir(variant_options)}/"
+        f"{FONT_NAME}{get_variant(variant_options)}-{merged_style}.ttf"
+    )
+
+
+def build_variants(pool, variants, manifest: dict) -> list:
+    """バリエーション x スタイルのジョブをワーカープールで実行し、エラー内容のリストを返す
+
+    manifest に記録された入力から変化のないフォントは再生成しない
+    manifest はビルド結果に合わせて更新する
+    """
+    restamp_keys = {f"build.ini:{key.lower()}" for key in RESTAMP_KEYS}
+    jobs = []
+    restamp_jobs = []
+    for variant_options in variants:
+        for style in font_settings.STYLES:
+            output_path = get_output_path(variant_options, style[2])
+            inputs = get_inputs(variant_options, style)
+            recorded = manifest.get(output_path)
+            if os.path.exists(output_path) and recorded is not None:
+                changed = {
+                    key
+                    for key in inputs.keys() | recorded.keys()
+                    if inputs.get(key) != recorded.get(key)
+                }
+                if len(changed) == 0:
+                    print(f"Skip {output_path} (inputs unchanged)")
+                    continue
+                if changed <= restamp_keys:
+                    # メタデータのみの変更は FontForge を使わずに書き換える
+                    restamp_jobs.append((output_path, inputs))
+                    continue
+            # 失敗した場合に古い結果を残さないよう、先に出力と記録を消しておく
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            manifest.pop(output_path, None)
+            jobs.append((variant_options, style, inputs))
+
+    # メタデータの書き換え
+    results = pool.map(run_restamp_job, [job[0] for job in restamp_jobs], chunksize=1)
+    errors = [e for e in results if e]
+    for (output_path, inputs), e in zip(restamp_jobs, results):
+        if e is None:
+            manifest[output_path] = inputs
+
+    if options.get("stream"):
+        # 合成からテーブル編集までを1つのジョブで行い、最終的なフォントのみを出力する
+        results = map_merge_jobs(pool, run_stream_job, [job[:2] for job in jobs])
+        errors += [e for e in results if e]
+        for (variant_options, style, inputs), e in zip(jobs, results):
+            if e is None:
+                manifest[get_output_path(variant_options, style[2])] = inputs
+        return errors
+
+    # 合成
+    results = map_merge_jobs(pool, run_merge_job, [job[:2] for job in jobs])
+    errors += [e for e in results if e]
+    jobs = [job for job, e in zip(jobs, results) if e is None]
+
+    # fontTools によるヒント削除とテーブル編集
+    results = pool.map(run_fonttools_job, [job[:2] for job in jobs], chunksize=1)
+    errors += [e for e in results if e]
+    for (variant_options, style, inputs), e in zip(jobs, results):
+        if e is None:
+            manifest[get_output_path(variant_options, style[2])] = inputs
+    return errors
+
+
+def map_merge_jobs(pool, func, jobs: list) -> list:
+    """合成のジョブを実行し、結果のリストを返す
+
+    FontForge で合成する場合は、フォントやモジュールの状態を次のジョブに持ち越さないよう、
+    fontforge_script.generate_fonts_parallel() と同じく1ジョブ毎にワーカープロセスを作り直す
+    """
+    if options["engine"] != "fontforge" or len(jobs) == 0:
+        return pool.map(func, jobs, chunksize=1)
+    with create_pool(maxtasksperchild=1) as merge_pool:
+        return merge_pool.map(func, jobs, chunksize=1)
+
+
+def build_web_fonts(pool, variants, manifest: dict) -> list:
+    """ビルド済みのフォントから Web フォントをフォント単位の並列で生成し、エラー内容のリストを返す
+
+    元のフォントと同じ入力から生成済みの Web フォントは再生成しない
+    manifest には元のフォントの入力を Web フォントの出力先をキーとして記録する
+    """
+    paths = [
+        get_output_path(variant_options, style[2])
+        for variant_options in variants
+        for style in font_settings.STYLES
+    ]
+    fonts = {}
+    jobs = []
+    for path in [p for p in paths if os.path.exists(p)]:
+        web_path = fonttools_script.get_web_font_path(path, None)
+        inputs = manifest.get(path)
+        if inputs is not None and manifest.get(web_path) == inputs:
+            subsets = fonttools_script.load_web_subsets(path)
+            web_paths = fonttools_script.get_web_font_paths(path, subsets)
+            if all(os.path.exists(p) for p in web_paths):
+                print(f"Skip {web_path} (inputs unchanged)")
+                fonts[path] = subsets
+                continue
+        manifest.pop(web_path, None)
+        jobs.append(path)
+
+    results = pool.map(run_web_job, jobs, chunksize=1)
+    errors = []
+    for path, (subsets, e) in zip(jobs, results):
+        if e is not None:
+            errors.append(e)
+            continue
+        fonts[path] = subsets
+        if path in manifest:
+            manifest[fonttools_script.get_web_font_path(path, None)] = manifest[path]
+    fonttools_script.write_web_css([(p, fonts[p]) for p in paths if p in fonts])
+    return errors
+
+
+def validate_variants(pool, variants) -> list:
+    """ビルド済みのフォントを並列に検証し、検証に失敗したフォントのエラー内容のリストを返す"""
+    paths = [
+        get_output_path(variant_options, style[2])
+        for variant_options in variants
+        for style in font_settings.STYLES
+    ]
+    jobs = validate_fonts.get_validate_jobs(
+        [p for p in paths if os.path.exists(p)], profile=options.get("profile")
+    )
+    results = pool.map(validate_fonts.run_validate_job, jobs, chunksize=1)
+    validate_fonts.write_report(validate_fonts.REPORT, results)
+    return [
+        f"{result['path']}: validation failed ({len(result['errors'])} errors)"
+        for result in results
+        if result["errors"]
+    ]
+
+
+def get_inputs(variant_options: dict, style) -> dict:
+    """出力フォントに影響する入力 (ファイルのハッシュ、設定値) を返す"""
+    src_style, dst_style, _, _ = style
+    paths = [
+        f"{SOURCE_FONTS_DIR}/{SRC_FONT}{src_style}.ttf",
+        f"{SOURCE_FONTS_DIR}/{DST_FONT}{dst_style}.ttf",
+        fonttools_script.ADD_CMAP_CSV,
+        coverage_profiles.PROFILES_INI,
+        *BUILD_SCRIPTS,
+    ]
+    if variant_options.get("nerd-fonts"):
+        paths.append(f"{SOURCE_FONTS_DIR}/{font_settings.NERD_FONT}")
+    if not variant_options.get("invisible-zenkaku-space"):
+        paths.append(f"{SOURCE_FONTS_DIR}/{IDEOGRAPHIC_SPACE}")
+
+    inputs = {path: get_file_hash(path) for path in paths}
+    inputs["engine"] = options["engine"]
+    # ツールの更新で出力が変わり得るため、バージョンも記録する
+    inputs["fontTools"] = fontTools.version
+    if options["engine"] == "fontforge":
+        inputs["fontforge"] = fontforge.version()
+    inputs["profile"] = options.get("profile", coverage_profiles.FULL_PROFILE)
+    inputs["dedup-outlines"] = options.get("dedup-outlines", False)
+    for key, value in settings["DEFAULT"].items():
+        inputs[f"build.ini:{key}"] = value
+    return inputs
+
+
+def get_file_hash(path: str) -> str:
+    """ファイルの内容の sha256 を返す"""
+    if path not in file_hashes:
+        with open(path, "rb") as f:
+            file_hashes[path] = hashlib.sha256(f.read()).hexdigest()
+    return file_hashes[path]
+
+
+def load_manifest() -> dict:
+    """前回のビルドの入力の記録を読み込む"""
+    if not os.path.exists(MANIFEST):
+        return {}
+    with open(MANIFEST, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict):
+    """ビルドの入力の記録を保存する"""
+    with open(MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def create_pool(maxtasksperchild=None):
+    """オプションを引き継いだワーカープールを作る"""
+    return multiprocessing.Pool(
+        processes=options.get("jobs", os.cpu_count() or 1),
+        initializer=init_worker,
+        initargs=(dict(options),),
+        maxtasksperchild=maxtasksperchild,
+    )
+
+
+def init_worker(build_options: dict):
+    """ワーカープロセスにオプションを引き継ぐ"""
+    global options
+    options = build_options
+
+
+def generate_merged_font(variant_options: dict, style, stream=False):
+    """--engine で指定した処理で1バリエーション・1スタイル分のフォントを合成する
+
+    stream を指定した場合は合成結果 (BytesIO または TTFont) を返す
+    """
+    src_style, dst_style, merged_style, italic = style
+    if options["engine"] == "fonttools":
+        script = fonttools_merge
+    else:
+        script = fontforge_script
+    # ワーカープロセスは使い回すため、ジョブ毎にオプションを差し替える
+    script.options = dict(variant_options)
+    for option in ["no-cache", "stage-report"]:
+        script.options[option] = options.get(option, False)
+    script.options["profile"] = options.get("profile", coverage_profiles.FULL_PROFILE)
+    return script.generate_font(
+        src_style,
+        dst_style,
+        merged_style,
+        italic=italic,
+        build_dir=get_build_dir(variant_options),
+        stream=stream,
+    )
+
+
+def run_merge_job(job):
+    """1バリエーション・1スタイル分のフォントを合成する"""
+    variant_options, style = job
+    try:
+        generate_merged_font(variant_options, style)
+    except Exception:
+        return (
+            f"{FONT_NAME}{get_variant(variant_options)}-{style[2]}\n"
+            f"{traceback.format_exc()}"
+        )
+    return None
+
+
+def run_stream_job(job):
+    """1バリエーション・1スタイル分のフォントを合成し、そのままテーブルを編集する"""
+    variant_options, style = job
+    try:
+        merged_font = generate_merged_font(variant_options, style, stream=True)
+        fonttools_script.fix_font_stream(
+            merged_font,
+            style[2],
+            get_variant(variant_options),
+            get_build_dir(variant_options),
+            stage_report=options.get("stage-report", False),
+            dedup_outlines=options.get("dedup-outlines", False),
+        )
+        if not os.path.exists(get_output_path(variant_options, style[2])):
+            raise RuntimeError("output font was not generated")
+    except Exception:
+        return (
+            f"{FONT_NAME}{get_variant(variant_options)}-{style[2]}\n"
+            f"{traceback.format_exc()}"
+        )
+    return None
+
+
+def run_restamp_job(output_path: str):
+    """ビルド済みのフォントのメタデータを書き換える"""
+    try:
+        fonttools_script.restamp_font(output_path)
+    except Exception:
+        return f"{output_path}\n{traceback.format_exc()}"
+    return None
+
+
+def run_web_job(path: str):
+    """1フォント分の Web フォントを生成し、(サブセットのリスト, エラー内容) を返す"""
+    try:
+        return fonttools_script.generate_web_font(path), None
+    except Exception:
+        return None, f"{path}\n{traceback.format_exc()}"
+
+
+def run_fonttools_job(job):
+    """1バリエーション・1スタイル分のフォントテーブルを編集する"""
+    variant_options, (_, _, merged_style, _) = job
+    build_dir = get_build_dir(variant_options)
+    input_path = (
+        f"{build_dir}/{FONTFORGE_PREFIX}{FONT_NAME}"
+        f"{get_variant(variant_options)}-{merged_style}.ttf"
+    )
+    try:
+        fonttools_script.fix_font_file(
+            input_path,
+            stage_report=options.get("stage-report", False),
+            dedup_outlines=options.get("dedup-outlines", False),
+        )
+        if not os.path.exists(get_output_path(variant_options, merged_style)):
+            raise RuntimeError("output font was not generated")
+    except Exception:
+        return f"{input_path}\n{traceback.format_exc()}"
+    finally:
+        # 中間ファイルを削除
+        if os.path.exists(input_path):
+            os.remove(input_path)
+    return None
+
+
+if __name__ == "__main__":
+    main()
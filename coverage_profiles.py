@@ -0,0 +1,72 @@
+#!/bin/env python3
+
+# 開発用ビルド (--profile) で合成するグリフを絞り込むカバレッジプロファイルを読み込む
+# fontforge_script.py, fonttools_merge.py, build.py から使用する
+# FontForge 付属の Python からも使えるよう、標準ライブラリのみを使う
+
+import configparser
+import functools
+
+# プロファイルを定義するファイル
+PROFILES_INI = "coverage_profiles.ini"
+# 全てのグリフを含めるプロファイル (リリースビルド用)
+FULL_PROFILE = "full"
+# JIS X 0208 の区の範囲を EUC-JP の第1バイトで表したもの
+JIS_ROWS = {
+    # 非漢字 (1〜8区)
+    "jis-symbols": (0xA1, 0xA8),
+    # 第1水準漢字 (16〜47区)
+    "jis1": (0xB0, 0xCF),
+    # 第2水準漢字 (48〜84区)
+    "jis2": (0xD0, 0xF4),
+}
+
+
+def get_profile_names(path: str = PROFILES_INI) -> list:
+    """定義されているプロファイル名のリストを返す"""
+    return read_profiles(path).sections()
+
+
+@functools.lru_cache(maxsize=None)
+def load_profile(name: str, path: str = PROFILES_INI):
+    """プロファイルに含めるコードポイントを返す (全てのグリフを含める場合は None)"""
+    profiles = read_profiles(path)
+    if not profiles.has_section(name):
+        raise ValueError(f"{path}: unknown profile: {name}")
+    ranges = profiles.get(name, "ranges")
+    if ranges.strip() == "all":
+        return None
+    codepoints = set()
+    for spec in f"{profiles.get(name, 'base')},{ranges}".split(","):
+        spec = spec.strip()
+        if spec == "":
+            continue
+        if spec in JIS_ROWS:
+            codepoints |= get_jis_codepoints(*JIS_ROWS[spec])
+            continue
+        start, _, end = spec.partition("-")
+        try:
+            codepoints.update(range(int(start, 16), int(end or start, 16) + 1))
+        except ValueError:
+            raise ValueError(f"{path}: [{name}] invalid range: {spec}")
+    return frozenset(codepoints)
+
+
+def read_profiles(path: str) -> configparser.ConfigParser:
+    """プロファイルの定義ファイルを読み込む"""
+    profiles = configparser.ConfigParser()
+    profiles.read(path, encoding="utf-8")
+    return profiles
+
+
+def get_jis_codepoints(first_row: int, last_row: int) -> frozenset:
+    """EUC-JP の第1バイトが first_row〜last_row の範囲にある文字のコードポイントを返す"""
+    codepoints = set()
+    for row in range(first_row, last_row + 1):
+        for cell in range(0xA1, 0xFF):
+            try:
+                char = bytes((row, cell)).decode("euc_jp")
+            except UnicodeDecodeError:
+                continue
+            codepoints.update(ord(c) for c in char)
+    return frozenset(codepoints)
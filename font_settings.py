@@ -0,0 +1,72 @@
+#!/bin/env python3
+
+# 合成・テーブル編集で共通に使う設定値
+# fontforge_script.py, fonttools_merge.py, fonttools_script.py, build.py から使用する
+# FontForge 付属の Python からも使えるよう、標準ライブラリのみを使う
+
+# Nerd Fonts のソースフォント
+NERD_FONT = "SymbolsNerdFont-Regular.ttf"
+
+# 生成するスタイル (src_style, dst_style, merged_style, italic)
+STYLES = (
+    ("Rg", "Regular", "Regular", False),
+    ("Bd", "Bold", "Bold", False),
+    ("Rg", "RegularItalic", "RegularItalic", True),
+    ("Bd", "BoldItalic", "BoldItalic", True),
+)
+
+# dst_font から削除するグリフのコードポイント。これにより合成時に src_font 側のグリフが優先される
+DELETE_DST_CODEPOINTS = (
+    # U+0000
+    *range(0x0000, 0x0000 + 1),
+    # 全角ASCII
+    *range(0xFF01, 0xFF5E + 1),
+    # カギ括弧 「」
+    *range(0xFF62, 0xFF63 + 1),
+    # 日本語頻出の約もの
+    *range(0x3001, 0x3015 + 1),
+    # 中点
+    *range(0x30FB, 0x30FB + 1),
+    # 卍
+    *range(0x534D, 0x534D + 1),
+    # 縦書き括弧
+    *range(0xFE35, 0xFE44 + 1),
+    *range(0xFE47, 0xFE48 + 1),
+)
+
+# 全角幅に揃える漢字の範囲 (CJK統合漢字拡張A, CJK統合漢字, CJK互換漢字)
+# LINE Seed Bold の一部の漢字 (U+4E3B, U+621B, U+6922, U+6F80) は幅が全角幅と異なる
+IDEOGRAPH_RANGES = (
+    (0x3400, 0x4DBF),
+    (0x4E00, 0x9FFF),
+    (0xF900, 0xFAFF),
+)
+
+# Powerline Symbols のうち、なぜかズレている右付きグリフの個別調整 (EM 1000 での移動量)
+POWERLINE_SHIFTS = {
+    0xE0B2: -353,
+    0xE0B6: -414,
+    0xE0C5: -137,
+    0xE0C7: -214,
+    0xE0D4: -314,
+}
+
+# name テーブルに設定する著作権表示とライセンス
+COPYRIGHT = """[LINE Seed]
+LINE Seed is copyrighted material owned by LINE Corp. (https://seed.line.me/index_jp.html)
+
+[JuliaMono]
+Copyright (c) 2020 - 2023, cormullion (https://github.com/cormullion/juliamono)
+
+[Juisee]
+Copyright 2022 Yuko Otawara
+"""  # noqa: E501
+LICENSE = """This Font Software is licensed under the SIL Open Font License,
+Version 1.1. This license is available with a FAQ
+at: http://scripts.sil.org/OFL"""
+LICENSE_URL = "http://scripts.sil.org/OFL"
+
+# OS/2 の ulCodePageRange1, 2
+# 一部ソフトで日本語表示ができなくなる事象への対策
+# なぜかJuliaMonoでは韓国語のビットが立っているので、それを除外し、代わりに日本語ビットを立てる
+OS2_CODEPAGES = (0b1100000000000100000000111111111, 0)
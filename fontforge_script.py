@@ -3,16 +3,37 @@
 # 2つのフォントを合成する
 
 import configparser
+import hashlib
+import inspect
+import io
 import math
+import multiprocessing
 import os
 import shutil
 import sys
+import tempfile
+import traceback
 import uuid
 from decimal import ROUND_HALF_UP, Decimal
 
 import fontforge
 import psMat
 
+import coverage_profiles
+import stage_profiler
+from font_settings import (
+    COPYRIGHT,
+    DELETE_DST_CODEPOINTS,
+    IDEOGRAPH_RANGES,
+    LICENSE,
+    LICENSE_URL,
+    NERD_FONT,
+    OS2_CODEPAGES,
+    POWERLINE_SHIFTS,
+    STYLES,
+)
+from stage_profiler import profile, stage
+
 # iniファイルを読み込む
 settings = configparser.ConfigParser()
 settings.read("build.ini", encoding="utf-8")
@@ -38,18 +59,17 @@ HALF_WIDTH_12 = int(settings.get("DEFAULT", "HALF_WIDTH_12"))
 FULL_WIDTH_35 = int(settings.get("DEFAULT", "FULL_WIDTH_35"))
 ENG_GLYPH_SCALE_12 = float(settings.get("DEFAULT", "ENG_GLYPH_SCALE_12"))
 
-COPYRIGHT = """[LINE Seed]
-LINE Seed is copyrighted material owned by LINE Corp. (https://seed.line.me/index_jp.html)
-
-[JuliaMono]
-Copyright (c) 2020 - 2023, cormullion (https://github.com/cormullion/juliamono)
+# 合成前の共通処理を行ったフォントのキャッシュ置き場
+CACHE_DIR = f"{BUILD_FONTS_DIR}/.cache"
+# 各処理の計測結果の出力先
+STAGE_REPORT_DIR = f"{BUILD_FONTS_DIR}/stage_report"
 
-[Juisee]
-Copyright 2022 Yuko Otawara
-"""  # noqa: E501
+# 空でも削除しないグリフ名
+KEEP_EMPTY_GLYPH_NAMES = (".notdef", ".null", "nonmarkingreturn")
 
 options = {}
-nerd_font = None
+# 半角幅毎に調整済みの Nerd Font をキャッシュする
+nerd_fonts = {}
 
 
 def main():
@@ -60,23 +80,30 @@ def main():
         return
 
     # buildディレクトリを作成する
-    if os.path.exists(BUILD_FONTS_DIR):
-        shutil.rmtree(BUILD_FONTS_DIR)
-    os.mkdir(BUILD_FONTS_DIR)
-    # regular スタイルを生成する
-    generate_font("Rg", "Regular", "Regular")
-    # bold スタイルを生成する
-    generate_font("Bd", "Bold", "Bold")
-    # regular italic スタイルを生成する
-    generate_font("Rg", "RegularItalic", "RegularItalic", italic=True)
-    # bold italic スタイルを生成する
-    generate_font("Bd", "BoldItalic", "BoldItalic", italic=True)
+    # キャッシュディレクトリは残す
+    clean_build_dir(BUILD_FONTS_DIR)
+
+    jobs = options.get("jobs", 1)
+    if jobs > 1:
+        # スタイル毎に別プロセスで生成する
+        results = generate_fonts_parallel(STYLES, jobs)
+    else:
+        results = [generate_font_job(style) for style in STYLES]
+
+    # 失敗したスタイルがあれば終了コードで通知する
+    failed = [(merged_style, error) for merged_style, error in results if error]
+    for merged_style, error in failed:
+        print(f"Error: failed to generate {merged_style} style\n{error}")
+    if failed:
+        sys.exit(1)
 
 
 def usage():
     print(
         f"Usage: {sys.argv[0]} "
-        "[--slashed-zero] [--invisible-zenkaku-space] [--half-width]"
+        "[--slashed-zero] [--invisible-zenkaku-space] [--half-width] [--nerd-fonts]"
+        " [--jobs N] [--no-cache] [--stage-report]"
+        f" [--profile {'|'.join(coverage_profiles.get_profile_names())}]"
     )
 
 
@@ -89,7 +116,8 @@ def get_options():
     if len(sys.argv) == 1:
         return
 
-    for arg in sys.argv[1:]:
+    args = iter(sys.argv[1:])
+    for arg in args:
         # オプション判定
         if arg == "--slashed-zero":
             options["slashed-zero"] = True
@@ -99,55 +127,117 @@ def get_options():
             options["half-width"] = True
         elif arg == "--nerd-fonts":
             options["nerd-fonts"] = True
+        elif arg == "--jobs":
+            # 並列に生成するスタイル数
+            jobs = next(args, "")
+            if not jobs.isdecimal() or int(jobs) < 1:
+                options["unknown-option"] = True
+                return
+            options["jobs"] = int(jobs)
+        elif arg == "--no-cache":
+            options["no-cache"] = True
+        elif arg == "--stage-report":
+            # 各処理の処理時間・メモリ使用量・グリフ数を計測する
+            options["stage-report"] = True
+        elif arg == "--profile":
+            # 合成するグリフをプロファイルのコードポイントに絞り込む (開発用)
+            options["profile"] = next(args, "")
+            if options["profile"] not in coverage_profiles.get_profile_names():
+                options["unknown-option"] = True
+                return
         else:
             options["unknown-option"] = True
             return
 
 
-def generate_font(src_style, dst_style, merged_style, italic=False):
-    print(f"=== Generate {merged_style} style ===")
+def clean_build_dir(build_dir: str):
+    """キャッシュディレクトリ以外を削除して build_dir を空にする"""
+    os.makedirs(build_dir, exist_ok=True)
+    for entry in os.scandir(build_dir):
+        if entry.path == os.path.normpath(CACHE_DIR):
+            continue
+        if entry.is_dir():
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
 
-    # 合成するフォントを開く
-    src_font, dst_font = open_fonts(src_style, dst_style)
 
-    # フォントのEMを1000に変換する
-    # src_font は既に1000なので dst_font のみ変換する
-    em_1000(dst_font)
+def generate_fonts_parallel(styles, jobs: int):
+    """スタイル毎に別プロセスでフォントを生成する"""
+    # fontforge の状態をスタイル間で共有しないよう、1タスク毎にプロセスを作り直す
+    with multiprocessing.Pool(
+        processes=min(jobs, len(styles)),
+        initializer=init_worker,
+        initargs=(dict(options),),
+        maxtasksperchild=1,
+    ) as pool:
+        return pool.map(generate_font_job, styles, chunksize=1)
 
-    # 合成前のグリフ調整
-    src_font, dst_font = delete_some_glyphs(src_font, dst_font)
 
-    # いくつかのグリフ形状に調整を加える
-    adjust_some_glyph(src_font)
+def init_worker(worker_options: dict):
+    """ワーカープロセスにオプションを引き継ぐ"""
+    global options
+    options = worker_options
+
+
+def generate_font_job(style):
+    """1スタイル分のフォントを生成し、(スタイル名, エラー内容) を返す"""
+    src_style, dst_style, merged_style, italic = style
+    try:
+        generate_font(src_style, dst_style, merged_style, italic=italic)
+    except Exception:
+        return merged_style, traceback.format_exc()
+    return merged_style, None
+
+
+def generate_font(
+    src_style,
+    dst_style,
+    merged_style,
+    italic=False,
+    build_dir=BUILD_FONTS_DIR,
+    stream=False,
+):
+    """フォントを合成して ttf を出力する
+
+    stream を指定した場合は build_dir に中間ファイルを残さず、生成した ttf を BytesIO で返す
+    """
+    print(f"=== Generate {merged_style} style ===")
+    stage_profiler.start(bool(options.get("stage-report")))
 
-    # 重複するグリフを削除する
-    delete_duplicate_glyphs(src_font, dst_font)
+    # 合成するフォントを開き、合成前の共通処理を行う
+    # 日本語フォントは幅の調整まで済んだ正体のフォントを開く
+    src_font, dst_font = open_preprocessed_fonts(src_style, dst_style)
 
-    # 日本語グリフの斜体を生成する
+    # 斜体化と英数字フォントの幅の調整はグリフ毎に変換を合成し、まとめて適用する
+    src_transforms, dst_transforms = {}, {}
+
+    # 正体の日本語グリフを傾けて斜体を生成する
     if italic:
-        transform_italic_glyphs(src_font)
+        transform_italic_glyphs(src_font, src_transforms)
 
     # スラッシュ付きゼロ
     if options.get("slashed-zero"):
         slashed_zero(dst_font)
 
-    # 3:5幅版との差分を調整する
+    # 幅毎のグリフを全グリフの走査なしで引けるように索引を作成する
+    src_index = index_glyphs(src_font)
+    dst_index = index_glyphs(dst_font)
+
+    # 1:2 幅にする (日本語フォント側は共通処理で調整済み)
     if options.get("half-width"):
-        # 1:2 幅にする
-        transform_half_width(src_font, dst_font)
-    else:
-        # src_fontで半角幅(500)のグリフの幅を3:5になるよう調整する
-        width_500_to_600(src_font)
+        transform_half_width_eng(dst_font, dst_transforms, dst_index)
 
-    # GSUB、GPOSテーブル調整
-    remove_lookups(src_font, remove_gsub=True, remove_gpos=True)
+    apply_transforms(src_font, src_transforms, src_index)
+    apply_transforms(dst_font, dst_transforms, dst_index)
 
     # Nerd Fontのグリフを追加する
     if options.get("nerd-fonts"):
-        add_nerd_font_glyphs(src_font, dst_font)
+        add_nerd_font_glyphs(src_font, dst_font, src_index, dst_index)
 
     # 合成する
-    dst_font.mergeFonts(src_font)
+    with stage("mergeFonts", dst_font):
+        dst_font.mergeFonts(src_font)
 
     if options.get("invisible-zenkaku-space"):
         # 全角スペースを不可視化する
@@ -157,12 +247,7 @@ def generate_font(src_style, dst_style, merged_style, italic=False):
         visualize_zenkaku_space(dst_font)
 
     # オプション毎の修飾子を追加する
-    variant = HALF_WIDTH_STR if options.get("half-width") else ""
-    variant += SLASHED_ZERO_STR if options.get("slashed-zero") else ""
-    variant += (
-        INVISIBLE_ZENKAKU_SPACE_STR if options.get("invisible-zenkaku-space") else ""
-    )
-    variant += NERD_FONTS_STR if options.get("nerd-fonts") else ""
+    variant = get_variant()
 
     # メタデータを編集する
     cap_height = int(
@@ -177,59 +262,311 @@ def generate_font(src_style, dst_style, merged_style, italic=False):
     )
     edit_meta_data(dst_font, merged_style, variant, cap_height, x_height)
 
+    # clear() 等で空になったグリフを削除する
+    prune_empty_glyphs(dst_font)
+
     # ttfファイルに保存
-    dst_font.generate(
-        f"{BUILD_FONTS_DIR}/{FONTFORGE_PREFIX}{FONT_NAME}{variant}-{merged_style}.ttf"
-    )
+    merged_font = None
+    with stage("generate", dst_font):
+        if stream:
+            # FontForge はファイルオブジェクトに出力できないため、ローカルの一時ディレクトリに
+            # 出力してメモリに読み込み、ビルドディレクトリには書き出さない
+            with tempfile.TemporaryDirectory() as temp_dir:
+                font_path = f"{temp_dir}/{FONT_NAME}{variant}-{merged_style}.ttf"
+                dst_font.generate(font_path)
+                with open(font_path, "rb") as f:
+                    merged_font = io.BytesIO(f.read())
+        else:
+            dst_font.generate(
+                f"{build_dir}/{FONTFORGE_PREFIX}{FONT_NAME}{variant}-{merged_style}.ttf"
+            )
 
     # ttfを閉じる
     src_font.close()
     dst_font.close()
 
+    stage_profiler.write_report(
+        f"{STAGE_REPORT_DIR}/{FONT_NAME}{variant}-{merged_style}_fontforge.json",
+        f"{FONT_NAME}{variant}-{merged_style} (fontforge_script.py)",
+    )
+    return merged_font
 
-def open_fonts(style_src: str, style_dst: str):
-    return fontforge.open(
-        f"{SOURCE_FONTS_DIR}/{SRC_FONT}{style_src}.ttf"
-    ), fontforge.open(f"{SOURCE_FONTS_DIR}/{DST_FONT}{style_dst}.ttf")
+
+def get_variant() -> str:
+    """オプション毎の修飾子を返す"""
+    variant = HALF_WIDTH_STR if options.get("half-width") else ""
+    variant += SLASHED_ZERO_STR if options.get("slashed-zero") else ""
+    variant += (
+        INVISIBLE_ZENKAKU_SPACE_STR if options.get("invisible-zenkaku-space") else ""
+    )
+    variant += NERD_FONTS_STR if options.get("nerd-fonts") else ""
+    return variant
 
 
+@profile
+def open_preprocessed_fonts(src_style: str, dst_style: str):
+    """合成前の共通処理を行ったフォントを開く
+
+    日本語フォントは幅の調整まで行った正体の中間結果を斜体と共用し、
+    合成先のフォントとの重複の削除のみスタイル毎に行う
+    """
+    src_font = open_cached_font(
+        f"{SRC_FONT}{src_style}",
+        get_jp_cache_key(src_style),
+        lambda: preprocess_jp_font(src_style),
+    )
+    dst_font = open_cached_font(
+        f"{DST_FONT}{dst_style}",
+        get_eng_cache_key(dst_style),
+        lambda: preprocess_eng_font(dst_style),
+    )
+
+    # 重複するグリフを削除する
+    delete_duplicate_glyphs(src_font, dst_font)
+
+    return src_font, dst_font
+
+
+def open_cached_font(name: str, cache_key: str, preprocess):
+    """preprocess で処理したフォントを開く
+
+    処理結果は入力に対するハッシュをキーとして CACHE_DIR に保存し、次回以降はそれを開く
+    """
+    if options.get("no-cache"):
+        return preprocess()
+
+    cache_path = f"{CACHE_DIR}/{name}_{cache_key}.sfd"
+    if os.path.exists(cache_path):
+        print(f"Use cached font: {cache_path}")
+        return fontforge.open(cache_path)
+
+    font = preprocess()
+    save_cache(font, cache_path)
+    return font
+
+
+@profile
+def preprocess_jp_font(src_style: str):
+    """日本語フォントを開き、斜体化以外の合成先に依存しない処理を行う
+
+    斜体はこの結果を傾けて生成するため、ここでは正体のまま幅の調整までを行う
+    """
+    jp_font = fontforge.open(f"{SOURCE_FONTS_DIR}/{SRC_FONT}{src_style}.ttf")
+    subset_to_profile(jp_font)
+
+    # WAVE DASH, FULLWIDTH TILDE
+    jp_font = copy_altuni(jp_font, (0x301C,))
+
+    # いくつかのグリフ形状に調整を加える
+    adjust_some_glyph(jp_font)
+
+    # GSUB、GPOSテーブル調整
+    remove_lookups(jp_font, remove_gsub=True, remove_gpos=True)
+
+    # 3:5幅版との差分を調整する
+    transforms = {}
+    index = index_glyphs(jp_font)
+    if options.get("half-width"):
+        # 1:2 幅にする
+        transform_half_width_jp(jp_font, transforms, index)
+    else:
+        # 半角幅(500)のグリフの幅を3:5になるよう調整する
+        width_500_to_600(jp_font, transforms, index)
+    apply_transforms(jp_font, transforms, index)
+
+    return jp_font
+
+
+@profile
+def preprocess_eng_font(dst_style: str):
+    """英数字フォントを開き、バリエーションに依存しない共通処理を行う"""
+    eng_font = fontforge.open(f"{SOURCE_FONTS_DIR}/{DST_FONT}{dst_style}.ttf")
+    subset_to_profile(eng_font)
+
+    # フォントのEMを1000に変換する
+    # 日本語フォントは既に1000なので英数字フォントのみ変換する
+    em_1000(eng_font)
+
+    # 合成前のグリフ調整
+    delete_some_glyphs(eng_font)
+
+    return eng_font
+
+
+def get_jp_cache_key(src_style: str) -> str:
+    """日本語フォントの共通処理の入力 (ソースフォント、設定値、処理内容) のハッシュを返す"""
+    return get_cache_key(
+        [f"{SOURCE_FONTS_DIR}/{SRC_FONT}{src_style}.ttf"],
+        # 幅の調整は 1:2 幅版とそれ以外で異なる
+        [
+            bool(options.get("half-width")),
+            HALF_WIDTH_12,
+            get_profile_ranges(),
+            IDEOGRAPH_RANGES,
+        ],
+        [
+            preprocess_jp_font,
+            subset_to_profile,
+            copy_altuni,
+            adjust_some_glyph,
+            is_ideograph,
+            remove_lookups,
+            transform_half_width_jp,
+            width_500_to_600,
+            add_transform,
+            apply_transforms,
+            index_glyphs,
+            get_glyphs_by_width,
+            get_glyph_by_codepoint,
+            set_glyph_width,
+            get_codepoints,
+        ],
+    )
+
+
+def get_eng_cache_key(dst_style: str) -> str:
+    """英数字フォントの共通処理の入力 (ソースフォント、設定値、処理内容) のハッシュを返す"""
+    return get_cache_key(
+        [f"{SOURCE_FONTS_DIR}/{DST_FONT}{dst_style}.ttf"],
+        [EM_ASCENT, EM_DESCENT, get_profile_ranges(), DELETE_DST_CODEPOINTS],
+        [
+            preprocess_eng_font,
+            subset_to_profile,
+            em_1000,
+            delete_some_glyphs,
+            clear_glyphs,
+            select_codepoints,
+            get_ranges,
+        ],
+    )
+
+
+@profile
+def subset_to_profile(font):
+    """--profile で指定したプロファイルに含まれないコードポイントのグリフを削除する
+
+    フォントを開いた直後に行い、以降の処理を少ないグリフで行えるようにする。
+    clear() ではグリフの枠とコードポイントが残り、以降の処理が全グリフを走査するため
+    removeGlyph() でフォントから取り除く。コードポイントのないグリフ (GSUB の置換先等) は残す
+    """
+    profile_codepoints = coverage_profiles.load_profile(
+        options.get("profile", coverage_profiles.FULL_PROFILE)
+    )
+    if profile_codepoints is None:
+        return
+    glyph_names = {
+        glyph.glyphname
+        for glyph in font.glyphs()
+        if get_codepoints(glyph) and not get_codepoints(glyph) & profile_codepoints
+    }
+    # 残すグリフが削除するグリフを参照している場合は、参照を輪郭に変換しておく
+    for glyph in font.glyphs():
+        if glyph.glyphname in glyph_names:
+            continue
+        for ref in glyph.references:
+            if ref[0] in glyph_names:
+                glyph.unlinkRef(ref[0])
+    for glyph_name in glyph_names:
+        font.removeGlyph(glyph_name)
+
+
+def get_profile_ranges():
+    """キャッシュのキー用に、プロファイルのコードポイントを範囲のリストで返す"""
+    profile_codepoints = coverage_profiles.load_profile(
+        options.get("profile", coverage_profiles.FULL_PROFILE)
+    )
+    if profile_codepoints is None:
+        return None
+    return get_ranges(profile_codepoints)
+
+
+def get_cache_key(paths: list, values: list, funcs: list) -> str:
+    """入力ファイルの内容、設定値、処理を行う関数のソースコードからキャッシュのキーを作る"""
+    sha256 = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            sha256.update(f.read())
+    sha256.update(",".join(map(str, values)).encode())
+    sha256.update(fontforge.version().encode())
+    # 処理内容が変わった場合にキャッシュを無効にするため、関数のソースコードも含める
+    for func in funcs:
+        sha256.update(inspect.getsource(func).encode())
+    return sha256.hexdigest()[:16]
+
+
+def save_cache(font, path: str):
+    """フォントをsfd形式でキャッシュに保存する"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # 並列実行時に書きかけのファイルを読まないよう、一時ファイルに保存してから置き換える
+    tmp_path = f"{path}.{uuid.uuid4()}.sfd"
+    font.save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+@profile
 def em_1000(font):
     """フォントのEMを1000に変換する"""
     em_size = EM_ASCENT + EM_DESCENT
     font.em = em_size
 
 
-def delete_some_glyphs(src_font, dst_font):
+@profile
+def delete_some_glyphs(dst_font):
     """dst_font側のグリフを削除する。これにより合成時にsrc_font側のグリフが優先される"""
-    # U+0000
-    clear_glyph_range(dst_font, 0x0000, 0x0000)
-    # 全角ASCII
-    clear_glyph_range(dst_font, 0xFF01, 0xFF5E)
-    # カギ括弧 「」
-    clear_glyph_range(dst_font, 0xFF62, 0xFF63)
-    # 日本語頻出の約もの
-    clear_glyph_range(dst_font, 0x3001, 0x3015)
-    # 中点
-    clear_glyph_range(dst_font, 0x30FB, 0x30FB)
-    # WAVE DASH, FULLWIDTH TILDE
-    src_font = copy_altuni(src_font, (0x301C,))
-    # 卍
-    clear_glyph_range(dst_font, 0x534D, 0x534D)
-    # 縦書き括弧
-    clear_glyph_range(dst_font, 0xFE35, 0xFE44)
-    clear_glyph_range(dst_font, 0xFE47, 0xFE48)
+    clear_glyphs(dst_font, DELETE_DST_CODEPOINTS)
+
+
+def clear_glyphs(font, codepoints, index=None):
+    """コードポイントのリストまたは range で指定したグリフをまとめて削除する
+
+    index を渡した場合は、削除したグリフを索引からも取り除く
+    """
+    select_codepoints(font, codepoints)
+    font.clear()
+    font.selection.none()
+    if index is not None:
+        unindex_glyphs(index, codepoints)
 
-    return src_font, dst_font
 
+def select_codepoints(font, codepoints):
+    """コードポイントのリストまたは range で指定したグリフをまとめて選択する
 
-def clear_glyph_range(font, start: int, end: int):
-    """グリフを削除する"""
-    for i in range(start, end + 1):
-        for glyph in font.selection.select(("ranges", None), i).byGlyphs:
-            glyph.clear()
+    フォントに存在しないコードポイントは無視する
+    """
     font.selection.none()
+    ranges = get_ranges(codepoints)
+    if len(ranges) == 0:
+        return
+    try:
+        # 連続するコードポイントを範囲にまとめ、1回で選択する
+        font.selection.select(
+            ("more", "ranges", "unicode"), *[cp for r in ranges for cp in r]
+        )
+    except Exception:
+        # 範囲外のコードポイントを含む場合は、範囲毎・コードポイント毎に選択し直す
+        for start, end in ranges:
+            try:
+                font.selection.select(("more", "ranges", "unicode"), start, end)
+            except Exception:
+                for codepoint in range(start, end + 1):
+                    try:
+                        font.selection.select(("more", "unicode"), codepoint)
+                    except Exception:
+                        pass
 
 
+def get_ranges(codepoints) -> list:
+    """コードポイントを連続する範囲 (開始, 終了) のリストにまとめる"""
+    ranges = []
+    for codepoint in sorted(set(codepoints)):
+        if ranges and ranges[-1][1] + 1 == codepoint:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    return [tuple(r) for r in ranges]
+
+
+@profile
 def copy_altuni(font, unicode_list):
     for unicode in unicode_list:
         glyph = font[unicode]
@@ -270,6 +607,7 @@ def copy_altuni(font, unicode_list):
     return reopen_font
 
 
+@profile
 def adjust_some_glyph(jp_font):
     """いくつかのグリフ形状に調整を加える"""
     full_width = jp_font[0x3042].width
@@ -284,21 +622,66 @@ def adjust_some_glyph(jp_font):
         glyph.transform(psMat.translate(180, 0))
         glyph.width = full_width
 
+    # 幅が全角幅からずれている漢字を、中央を保ったまま全角幅にする
+    for glyph in jp_font.glyphs():
+        if glyph.width != full_width and is_ideograph(glyph.unicode):
+            glyph.transform(psMat.translate((full_width - glyph.width) / 2, 0))
+            glyph.width = full_width
+
 
+def is_ideograph(codepoint: int) -> bool:
+    """全角幅に揃える漢字のコードポイントであれば True を返す"""
+    return any(start <= codepoint <= end for start, end in IDEOGRAPH_RANGES)
+
+
+@profile
 def delete_duplicate_glyphs(src_font, dst_font):
     """src_fontとdst_fontのグリフを比較し、重複するグリフを削除する"""
-    for glyph in src_font.glyphs():
-        if glyph.unicode > 0:
-            dst_font.selection.select(("more", "unicode"), glyph.unicode)
-    for glyph in dst_font.selection.byGlyphs:
+    # dst_font 側で出力対象となるグリフのコードポイント (altuni を含む)
+    dst_codepoints = set()
+    dst_count = 0
+    for glyph in dst_font.glyphs():
         if glyph.isWorthOutputting():
-            src_font.selection.select(("more", "unicode"), glyph.unicode)
-    for glyph in src_font.selection.byGlyphs:
-        glyph.clear()
+            dst_codepoints.update(get_codepoints(glyph))
+            if glyph.unicode > 0:
+                dst_count += 1
+
+    # dst_font 側と重複する src_font 側のグリフをまとめて削除する
+    # altuni で重複する場合も、エンコーディングで選択する場合と同様にグリフごと削除する
+    duplicate_glyphs = [
+        glyph.glyphname
+        for glyph in src_font.glyphs()
+        if not get_codepoints(glyph).isdisjoint(dst_codepoints)
+    ]
+    if duplicate_glyphs:
+        src_font.selection.select(*duplicate_glyphs)
+        src_font.clear()
     src_font.selection.none()
-    dst_font.selection.none()
+
+    # 合成結果のカバレッジの確認用に、それぞれのフォントから採用されるグリフ数を出力する
+    src_count = sum(
+        1
+        for glyph in src_font.glyphs()
+        if glyph.unicode > 0 and glyph.isWorthOutputting()
+    )
+    print(
+        f"Duplicate glyphs: {len(duplicate_glyphs)} removed, "
+        f"{src_font.fontname}: {src_count} glyphs, "
+        f"{dst_font.fontname}: {dst_count} glyphs"
+    )
+
+
+def get_codepoints(glyph) -> set:
+    """グリフに割り当てられたコードポイント (altuni を含む) を返す"""
+    codepoints = set()
+    if glyph.unicode != -1:
+        codepoints.add(glyph.unicode)
+    if glyph.altuni is not None:
+        codepoints.update(altuni[0] for altuni in glyph.altuni)
+    return codepoints
 
 
+@profile
 def remove_lookups(font, remove_gsub=True, remove_gpos=True):
     """GSUB, GPOSテーブルを削除する"""
     if remove_gsub:
@@ -312,16 +695,25 @@ def remove_lookups(font, remove_gsub=True, remove_gpos=True):
             font.removeLookup(lookup)
 
 
-def transform_italic_glyphs(font):
+@profile
+def transform_italic_glyphs(font, transforms=None):
+    """全グリフを斜体に変換する
+
+    transforms を渡した場合は変換を transforms に追加するのみで、適用は apply_transforms で行う
+    """
     # 斜体の傾き
     ITALIC_SLOPE = 9
     # 傾きを設定する
     font.italicangle = -ITALIC_SLOPE
     # 全グリフを斜体に変換
+    pending = {} if transforms is None else transforms
     for glyph in font.glyphs():
-        glyph.transform(psMat.skew(ITALIC_SLOPE * math.pi / 180))
+        add_transform(pending, glyph, psMat.skew(ITALIC_SLOPE * math.pi / 180))
+    if transforms is None:
+        apply_transforms(font, pending)
 
 
+@profile
 def slashed_zero(font):
     # "zero.zero" を "zero" にコピーする
     font.selection.select("zero.zero")
@@ -331,43 +723,184 @@ def slashed_zero(font):
     font.selection.none()
 
 
-def width_500_to_600(font):
-    """幅が500のグリフを600に変更する"""
-    for glyph in font.glyphs():
-        if glyph.width == 500:
-            # グリフ位置を50右にずらしてから幅を600にする
-            glyph.transform(psMat.translate(50, 0))
-            glyph.width = 600
+@profile
+def width_500_to_600(font, transforms=None, index=None):
+    """幅が500のグリフを600に変更する
+
+    transforms を渡した場合は変換を transforms に追加するのみで、適用は apply_transforms で行う
+    """
+    pending = {} if transforms is None else transforms
+    if index is None:
+        index = index_glyphs(font)
+    for glyph in get_glyphs_by_width(index, 500):
+        # グリフ位置を50右にずらしてから幅を600にする
+        add_transform(pending, glyph, psMat.translate(50, 0), 600)
+    if transforms is None:
+        apply_transforms(font, pending, index)
 
 
-def transform_half_width(jp_font, eng_font):
-    """1:2幅になるように変換する"""
-    for glyph in eng_font.selection.select(("unicode", None), 0x0030).byGlyphs:
-        before_width_eng = glyph.width
+@profile
+def transform_half_width_eng(eng_font, transforms=None, index=None):
+    """英数字フォントを1:2幅になるように変換する
+
+    transforms を渡した場合は変換を transforms に追加するのみで、適用は apply_transforms で行う
+    """
+    pending = {} if transforms is None else transforms
+    if index is None:
+        index = index_glyphs(eng_font)
+
+    before_width_eng = get_glyph_by_codepoint(index, 0x0030).width
     after_width_eng = HALF_WIDTH_12
-    for glyph in eng_font.glyphs():
-        if glyph.width == before_width_eng:
-            # 縮小
-            glyph.transform(psMat.scale(ENG_GLYPH_SCALE_12, 1))
-            # グリフ位置を調整してから幅を設定
-            glyph.transform(psMat.translate(-(glyph.width - after_width_eng) / 2, 0))
-            glyph.width = after_width_eng
-
-    for glyph in jp_font.selection.select(("unicode", None), 0x3042).byGlyphs:
-        before_half_width_jp = glyph.width / 2
-        before_full_width_jp = glyph.width
+    # 縮小するとグリフの幅も縮小されるため、位置の調整は縮小後の幅を基準にする
+    scaled_width_eng = before_width_eng * ENG_GLYPH_SCALE_12
+    for glyph in get_glyphs_by_width(index, before_width_eng):
+        # 縮小してからグリフ位置を調整し、幅を設定
+        add_transform(pending, glyph, psMat.scale(ENG_GLYPH_SCALE_12, 1))
+        add_transform(
+            pending,
+            glyph,
+            psMat.translate(-(scaled_width_eng - after_width_eng) / 2, 0),
+            after_width_eng,
+        )
+
+    if transforms is None:
+        apply_transforms(eng_font, pending, index)
+
+
+@profile
+def transform_half_width_jp(jp_font, transforms=None, index=None):
+    """日本語フォントを1:2幅になるように変換する
+
+    半角グリフは英数字グリフと同じ HALF_WIDTH_12 の幅にする。
+    transforms を渡した場合は変換を transforms に追加するのみで、適用は apply_transforms で行う
+    """
+    pending = {} if transforms is None else transforms
+    if index is None:
+        index = index_glyphs(jp_font)
+
+    after_width_eng = HALF_WIDTH_12
+    before_full_width_jp = get_glyph_by_codepoint(index, 0x3042).width
+    before_half_width_jp = before_full_width_jp / 2
     after_width_jp = HALF_WIDTH_12 * 2
-    for glyph in jp_font.glyphs():
-        if glyph.width == before_half_width_jp:
-            # 英数字グリフと同じ幅にする
-            glyph.transform(psMat.translate(-(glyph.width - after_width_eng) / 2, 0))
-            glyph.width = after_width_eng
-        elif glyph.width == before_full_width_jp:
-            # グリフ位置を調整してから幅を設定
-            glyph.transform(psMat.translate(-(glyph.width - after_width_jp) / 2, 0))
-            glyph.width = after_width_jp
+    for glyph in get_glyphs_by_width(index, before_half_width_jp):
+        # 英数字グリフと同じ幅にする
+        add_transform(
+            pending,
+            glyph,
+            psMat.translate(-(before_half_width_jp - after_width_eng) / 2, 0),
+            after_width_eng,
+        )
+    for glyph in get_glyphs_by_width(index, before_full_width_jp):
+        # グリフ位置を調整してから幅を設定
+        add_transform(
+            pending,
+            glyph,
+            psMat.translate(-(before_full_width_jp - after_width_jp) / 2, 0),
+            after_width_jp,
+        )
+
+    if transforms is None:
+        apply_transforms(jp_font, pending, index)
 
 
+def add_transform(transforms: dict, glyph, matrix, width=None):
+    """グリフに適用する変換を transforms に追加する
+
+    同じグリフに複数回追加した場合は、追加した順に適用する1つの変換行列に合成する。
+    width を指定した場合は変換後にグリフの幅を width にする。
+    """
+    _, current_matrix, current_width = transforms.get(
+        glyph.glyphname, (glyph, psMat.identity(), None)
+    )
+    transforms[glyph.glyphname] = (
+        glyph,
+        psMat.compose(current_matrix, matrix),
+        current_width if width is None else width,
+    )
+
+
+@profile
+def apply_transforms(font, transforms: dict, index=None):
+    """add_transform で追加した変換と幅の変更を、グリフ毎に1回でまとめて適用する
+
+    index を渡した場合は、変更した幅を索引にも反映する
+    """
+    identity = psMat.identity()
+    for glyph, matrix, width in transforms.values():
+        if matrix != identity:
+            glyph.transform(matrix)
+        if width is None:
+            pass
+        elif index is not None:
+            set_glyph_width(index, glyph, width)
+        else:
+            glyph.width = width
+    transforms.clear()
+
+
+def index_glyphs(font) -> dict:
+    """グリフを幅とコードポイントで引けるようにした索引を作成する
+
+    索引は set_glyph_width、clear_glyphs で更新する。
+    mergeFonts 等で索引を介さずにグリフを変更した後は作り直すこと。
+    """
+    index = {"font": font, "widths": {}, "codepoints": {}}
+    altunis = {}
+    for glyph in font.glyphs():
+        index["widths"].setdefault(glyph.width, set()).add(glyph.glyphname)
+        if glyph.unicode != -1:
+            index["codepoints"][glyph.unicode] = glyph.glyphname
+        for codepoint in get_codepoints(glyph):
+            altunis.setdefault(codepoint, glyph.glyphname)
+    # altuni よりも unicode に割り当てられたグリフを優先する
+    for codepoint, glyphname in altunis.items():
+        index["codepoints"].setdefault(codepoint, glyphname)
+    return index
+
+
+def get_glyphs_by_width(index: dict, width) -> list:
+    """幅が width のグリフをグリフ名順に返す"""
+    return [index["font"][name] for name in sorted(index["widths"].get(width, ()))]
+
+
+def get_glyph_by_codepoint(index: dict, codepoint: int):
+    """コードポイントに割り当てられたグリフを返す (存在しない場合は None)"""
+    glyphname = index["codepoints"].get(codepoint)
+    return None if glyphname is None else index["font"][glyphname]
+
+
+def set_glyph_width(index: dict, glyph, width):
+    """グリフの幅を変更し、索引に反映する"""
+    names = index["widths"].get(glyph.width)
+    if names is not None:
+        names.discard(glyph.glyphname)
+        if not names:
+            del index["widths"][glyph.width]
+    glyph.width = width
+    index["widths"].setdefault(width, set()).add(glyph.glyphname)
+
+
+def unindex_glyphs(index: dict, codepoints):
+    """コードポイントに割り当てられたグリフを索引から取り除く"""
+    glyphnames = {
+        index["codepoints"][codepoint]
+        for codepoint in codepoints
+        if codepoint in index["codepoints"]
+    }
+    if not glyphnames:
+        return
+    index["codepoints"] = {
+        codepoint: glyphname
+        for codepoint, glyphname in index["codepoints"].items()
+        if glyphname not in glyphnames
+    }
+    for width in list(index["widths"]):
+        index["widths"][width] -= glyphnames
+        if not index["widths"][width]:
+            del index["widths"][width]
+
+
+@profile
 def invisible_zenkaku_space(jp_font):
     """全角スペースを不可視化する"""
     # U+3000 の表示が U+2003 の透過的参照になっているのを解除
@@ -378,12 +911,11 @@ def invisible_zenkaku_space(jp_font):
     new_glyph.width = jp_font[0x3042].width
 
 
+@profile
 def visualize_zenkaku_space(jp_font):
     """全角スペースを可視化する"""
-    # 全角スペースを差し替え
-    glyph = jp_font[0x3042]
-    width_to = glyph.width
-    glyph.clear()
+    # 全角スペースを差し替え (幅は全角幅に合わせる)
+    width_to = jp_font[0x3042].width
     jp_font.mergeFonts(fontforge.open(f"{SOURCE_FONTS_DIR}/{IDEOGRAPHIC_SPACE}"))
     # 幅を設定し位置調整
     jp_font.selection.select("U+3000")
@@ -394,81 +926,156 @@ def visualize_zenkaku_space(jp_font):
     jp_font.selection.none()
 
 
-def add_nerd_font_glyphs(jp_font, eng_font):
-    """Nerd Fontのグリフを追加する"""
-    global nerd_font
-    # Nerd Fontのグリフを追加する
-    if nerd_font is None:
-        nerd_font = fontforge.open(f"{SOURCE_FONTS_DIR}/SymbolsNerdFont-Regular.ttf")
-        nerd_font.em = EM_ASCENT + EM_DESCENT
-        glyph_names = set()
-        for nerd_glyph in nerd_font.glyphs():
-            # Nerd Fontsのグリフ名をユニークにするため接尾辞を付ける
-            nerd_glyph.glyphname = f"{nerd_glyph.glyphname}-nf"
-            # postテーブルでのグリフ名重複対策
-            # fonttools merge で合成した後、MacOSで `'post'テーブルの使用性` エラーが発生することへの対処
-            if nerd_glyph.glyphname in glyph_names:
-                nerd_glyph.glyphname = f"{nerd_glyph.glyphname}-{nerd_glyph.encoding}"
-            glyph_names.add(nerd_glyph.glyphname)
-            # 幅を調整する
-            half_width = eng_font[0x0030].width
-            # Powerline Symbols の調整
-            if 0xE0B0 <= nerd_glyph.unicode <= 0xE0D4:
-                # なぜかズレている右付きグリフの個別調整 (EM 1000 に変更した後を想定して調整)
-                original_width = nerd_glyph.width
-                if nerd_glyph.unicode == 0xE0B2:
-                    nerd_glyph.transform(psMat.translate(-353, 0))
-                elif nerd_glyph.unicode == 0xE0B6:
-                    nerd_glyph.transform(psMat.translate(-414, 0))
-                elif nerd_glyph.unicode == 0xE0C5:
-                    nerd_glyph.transform(psMat.translate(-137, 0))
-                elif nerd_glyph.unicode == 0xE0C7:
-                    nerd_glyph.transform(psMat.translate(-214, 0))
-                elif nerd_glyph.unicode == 0xE0D4:
-                    nerd_glyph.transform(psMat.translate(-314, 0))
-                nerd_glyph.width = original_width
-                # 位置と幅合わせ
-                if nerd_glyph.width < half_width:
-                    nerd_glyph.transform(
-                        psMat.translate((half_width - nerd_glyph.width) / 2, 0)
-                    )
-                elif nerd_glyph.width > half_width:
-                    nerd_glyph.transform(psMat.scale(half_width / nerd_glyph.width, 1))
-                # グリフの高さ・位置を調整する
-                nerd_glyph.transform(psMat.scale(1, 1.14))
-                nerd_glyph.transform(psMat.translate(0, 21))
-            elif nerd_glyph.width < (EM_ASCENT + EM_DESCENT) * 0.6:
-                # 幅が狭いグリフは中央寄せとみなして調整する
+@profile
+def add_nerd_font_glyphs(jp_font, eng_font, jp_index=None, eng_index=None):
+    """Nerd Fontのグリフを追加する
+
+    jp_index, eng_index を渡した場合は、削除したグリフを索引からも取り除く
+    """
+    # Nerd Fontのグリフ幅は英数字の幅に合わせる
+    if eng_index is None:
+        half_width = eng_font[0x0030].width
+    else:
+        half_width = get_glyph_by_codepoint(eng_index, 0x0030).width
+    nerd_font = open_nerd_font(half_width)
+
+    # 日本語フォントにマージするため、既に存在する場合は削除する
+    nerd_codepoints = [
+        nerd_glyph.unicode
+        for nerd_glyph in nerd_font.glyphs()
+        if nerd_glyph.unicode != -1
+    ]
+    clear_glyphs(jp_font, nerd_codepoints, jp_index)
+    clear_glyphs(eng_font, nerd_codepoints, eng_index)
+
+    jp_font.mergeFonts(nerd_font)
+
+
+@profile
+def open_nerd_font(half_width: int):
+    """半角幅に合わせて調整済みの Nerd Font を開く
+
+    調整結果はプロセス内に加えて CACHE_DIR にも保存し、
+    スタイル・バリエーション・実行をまたいで再利用する
+    """
+    # 同一プロセスで半角幅の異なるバリエーションを生成することがあるため、半角幅毎にキャッシュする
+    nerd_font = nerd_fonts.get(half_width)
+    if nerd_font is not None:
+        return nerd_font
+
+    if options.get("no-cache"):
+        nerd_font = normalize_nerd_font(half_width)
+    else:
+        cache_key = get_cache_key(
+            [f"{SOURCE_FONTS_DIR}/{NERD_FONT}"],
+            [
+                half_width,
+                EM_ASCENT,
+                EM_DESCENT,
+                get_profile_ranges(),
+                sorted(POWERLINE_SHIFTS.items()),
+            ],
+            [normalize_nerd_font, subset_to_profile],
+        )
+        nerd_font_name = os.path.splitext(NERD_FONT)[0]
+        cache_path = f"{CACHE_DIR}/{nerd_font_name}_{half_width}_{cache_key}.sfd"
+        if os.path.exists(cache_path):
+            print(f"Use cached font: {cache_path}")
+            nerd_font = fontforge.open(cache_path)
+        else:
+            nerd_font = normalize_nerd_font(half_width)
+            save_cache(nerd_font, cache_path)
+
+    nerd_fonts[half_width] = nerd_font
+    return nerd_font
+
+
+def normalize_nerd_font(half_width: int):
+    """Nerd Font を開き、EM、グリフ名、位置、幅を合成先に合わせて調整する"""
+    nerd_font = fontforge.open(f"{SOURCE_FONTS_DIR}/{NERD_FONT}")
+    subset_to_profile(nerd_font)
+    nerd_font.em = EM_ASCENT + EM_DESCENT
+    glyph_names = set()
+    for nerd_glyph in nerd_font.glyphs():
+        # Nerd Fontsのグリフ名をユニークにするため接尾辞を付ける
+        nerd_glyph.glyphname = f"{nerd_glyph.glyphname}-nf"
+        # postテーブルでのグリフ名重複対策
+        # fonttools merge で合成した後、MacOSで `'post'テーブルの使用性` エラーが発生することへの対処
+        if nerd_glyph.glyphname in glyph_names:
+            nerd_glyph.glyphname = f"{nerd_glyph.glyphname}-{nerd_glyph.encoding}"
+        glyph_names.add(nerd_glyph.glyphname)
+        # Powerline Symbols の調整
+        if 0xE0B0 <= nerd_glyph.unicode <= 0xE0D4:
+            # なぜかズレている右付きグリフの個別調整 (EM 1000 に変更した後を想定して調整)
+            original_width = nerd_glyph.width
+            if nerd_glyph.unicode in POWERLINE_SHIFTS:
+                nerd_glyph.transform(
+                    psMat.translate(POWERLINE_SHIFTS[nerd_glyph.unicode], 0)
+                )
+            nerd_glyph.width = original_width
+            # 位置と幅合わせ
+            if nerd_glyph.width < half_width:
                 nerd_glyph.transform(
                     psMat.translate((half_width - nerd_glyph.width) / 2, 0)
                 )
-            # 幅を設定
-            nerd_glyph.width = half_width
-    # 日本語フォントにマージするため、既に存在する場合は削除する
-    for nerd_glyph in nerd_font.glyphs():
-        if nerd_glyph.unicode != -1:
-            # 既に存在する場合は削除する
-            try:
-                for glyph in jp_font.selection.select(
-                    ("unicode", None), nerd_glyph.unicode
-                ).byGlyphs:
-                    glyph.clear()
-            except Exception:
-                pass
-            try:
-                for glyph in eng_font.selection.select(
-                    ("unicode", None), nerd_glyph.unicode
-                ).byGlyphs:
-                    glyph.clear()
-            except Exception:
-                pass
+            elif nerd_glyph.width > half_width:
+                nerd_glyph.transform(psMat.scale(half_width / nerd_glyph.width, 1))
+            # グリフの高さ・位置を調整する
+            nerd_glyph.transform(psMat.scale(1, 1.14))
+            nerd_glyph.transform(psMat.translate(0, 21))
+        elif nerd_glyph.width < (EM_ASCENT + EM_DESCENT) * 0.6:
+            # 幅が狭いグリフは中央寄せとみなして調整する
+            nerd_glyph.transform(
+                psMat.translate((half_width - nerd_glyph.width) / 2, 0)
+            )
+        # 幅を設定
+        nerd_glyph.width = half_width
+
+    return nerd_font
+
+
+@profile
+def prune_empty_glyphs(font):
+    """空のグリフのうち、出力対象外またはコードポイントを持たず、どこからも参照されないものを削除する
+
+    clear_glyphs、delete_duplicate_glyphs、Nerd Fonts と重複するグリフの削除で clear() した
+    グリフはコードポイントを持ったままフォントに残るため、generate の前にまとめて取り除く。
+    clear() で幅の設定も消えるため、isWorthOutputting() で判定する。
+    U+2800 (点字の空白) 等の元から空のグリフは幅が設定されており出力対象のため残る。
+    他のグリフや GSUB 等のルックアップから参照されるグリフも残す
+    """
+    referenced = set()
+    for glyph in font.glyphs():
+        referenced.update(ref[0] for ref in glyph.references)
+        for possub in glyph.getPosSub("*"):
+            # ルックアップの置換元・置換先、ペアの相手のグリフ
+            referenced.add(glyph.glyphname)
+            referenced.update(v for v in possub[2:] if isinstance(v, str))
+
+    pruned = [
+        glyph.glyphname
+        for glyph in font.glyphs()
+        if glyph.glyphname not in referenced and is_empty_glyph(glyph)
+    ]
+    for glyph_name in pruned:
+        font.removeGlyph(glyph_name)
 
-    jp_font.mergeFonts(nerd_font)
+    print(
+        f"Pruned glyphs: {len(pruned)} removed, "
+        f"{sum(1 for _ in font.glyphs())} glyphs remain"
+    )
 
-    jp_font.selection.none()
-    eng_font.selection.none()
+
+def is_empty_glyph(glyph) -> bool:
+    """削除してよい空のグリフであれば True を返す"""
+    if glyph.glyphname in KEEP_EMPTY_GLYPH_NAMES:
+        return False
+    if len(glyph.foreground) > 0 or len(glyph.references) > 0:
+        return False
+    return len(get_codepoints(glyph)) == 0 or not glyph.isWorthOutputting()
 
 
+@profile
 def edit_meta_data(font, weight: str, variant: str, cap_height: int, x_height: int):
     """フォント内のメタデータを編集する"""
     font.ascent = EM_ASCENT
@@ -491,18 +1098,11 @@ def edit_meta_data(font, weight: str, variant: str, cap_height: int, x_height: i
     font.os2_capheight = cap_height
 
     # 一部ソフトで日本語表示ができなくなる事象への対策
-    # なぜかJuliaMonoでは韓国語のビットが立っているので、それを除外し、代わりに日本語ビットを立てる
-    font.os2_codepages = (0b1100000000000100000000111111111, 0)
+    font.os2_codepages = OS2_CODEPAGES
 
     font.sfnt_names = (
-        (
-            "English (US)",
-            "License",
-            """This Font Software is licensed under the SIL Open Font License,
-Version 1.1. This license is available with a FAQ
-at: http://scripts.sil.org/OFL""",
-        ),
-        ("English (US)", "License URL", "http://scripts.sil.org/OFL"),
+        ("English (US)", "License", LICENSE),
+        ("English (US)", "License URL", LICENSE_URL),
         ("English (US)", "Version", VERSION),
     )
     font.familyname = f"{FONT_NAME} {variant}".strip()
@@ -0,0 +1,851 @@
+#!/bin/env python3
+
+# FontForge を使わずに fontTools のみで2つのフォントを合成する
+# fontforge_script.py と同じ中間ファイル (fontforge_ 接頭辞) を出力する
+# 合成結果は fontforge_script.py を基準とし、処理内容を変更する場合は両方を揃えること
+
+import configparser
+import copy
+import math
+import os
+import re
+import sys
+import traceback
+from array import array
+
+from fontTools import subset
+from fontTools.misc.transform import Identity, Transform
+from fontTools.pens.cu2quPen import Cu2QuPen
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont
+from fontTools.ttLib.scaleUpem import scale_upem
+from fontTools.ttLib.tables import ttProgram
+from fontTools.ttLib.tables._c_m_a_p import CmapSubtable
+from fontTools.ttLib.tables._g_l_y_f import Glyph, flagOnCurve
+
+import coverage_profiles
+import fonttools_script
+import stage_profiler
+from font_settings import (
+    DELETE_DST_CODEPOINTS,
+    IDEOGRAPH_RANGES,
+    NERD_FONT,
+    POWERLINE_SHIFTS,
+    STYLES,
+)
+from stage_profiler import profile, stage
+
+# iniファイルを読み込む
+settings = configparser.ConfigParser()
+settings.read("build.ini", encoding="utf-8")
+
+FONT_NAME = settings.get("DEFAULT", "FONT_NAME")
+SRC_FONT = settings.get("DEFAULT", "SRC_FONT")
+DST_FONT = settings.get("DEFAULT", "DST_FONT")
+SOURCE_FONTS_DIR = settings.get("DEFAULT", "SOURCE_FONTS_DIR")
+BUILD_FONTS_DIR = settings.get("DEFAULT", "BUILD_FONTS_DIR")
+FONTFORGE_PREFIX = settings.get("DEFAULT", "FONTFORGE_PREFIX")
+IDEOGRAPHIC_SPACE = settings.get("DEFAULT", "IDEOGRAPHIC_SPACE")
+HALF_WIDTH_STR = settings.get("DEFAULT", "HALF_WIDTH_STR")
+SLASHED_ZERO_STR = settings.get("DEFAULT", "SLASHED_ZERO_STR")
+INVISIBLE_ZENKAKU_SPACE_STR = settings.get("DEFAULT", "INVISIBLE_ZENKAKU_SPACE_STR")
+NERD_FONTS_STR = settings.get("DEFAULT", "NERD_FONTS_STR")
+EM_ASCENT = int(settings.get("DEFAULT", "EM_ASCENT"))
+EM_DESCENT = int(settings.get("DEFAULT", "EM_DESCENT"))
+HALF_WIDTH_12 = int(settings.get("DEFAULT", "HALF_WIDTH_12"))
+ENG_GLYPH_SCALE_12 = float(settings.get("DEFAULT", "ENG_GLYPH_SCALE_12"))
+
+# 各処理の計測結果の出力先
+STAGE_REPORT_DIR = f"{BUILD_FONTS_DIR}/stage_report"
+# 合成時に残す日本語フォントの GSUB の機能
+JP_GSUB_FEATURES = ["vert", "vrt2"]
+# 合成に使わないため、グリフを絞る際に削除するテーブル
+DROP_TABLES = ["GPOS", "vhea", "vmtx", "PfEd"]
+
+options = {}
+# 半角幅毎に調整済みの Nerd Font をキャッシュする
+nerd_fonts = {}
+
+
+def main():
+    # オプション判定
+    get_options()
+    if options.get("unknown-option"):
+        usage()
+        return
+
+    os.makedirs(BUILD_FONTS_DIR, exist_ok=True)
+
+    failed = False
+    for src_style, dst_style, merged_style, italic in STYLES:
+        try:
+            generate_font(src_style, dst_style, merged_style, italic=italic)
+        except Exception:
+            print(f"Error: failed to generate {merged_style} style")
+            traceback.print_exc()
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+def usage():
+    print(
+        f"Usage: {sys.argv[0]} "
+        "[--slashed-zero] [--invisible-zenkaku-space] [--half-width] [--nerd-fonts]"
+        " [--stage-report]"
+        f" [--profile {'|'.join(coverage_profiles.get_profile_names())}]"
+    )
+
+
+def get_options():
+    """オプションを取得する"""
+
+    global options
+
+    # オプションなしの場合は何もしない
+    if len(sys.argv) == 1:
+        return
+
+    args = iter(sys.argv[1:])
+    for arg in args:
+        # オプション判定
+        if arg == "--slashed-zero":
+            options["slashed-zero"] = True
+        elif arg == "--invisible-zenkaku-space":
+            options["invisible-zenkaku-space"] = True
+        elif arg == "--half-width":
+            options["half-width"] = True
+        elif arg == "--nerd-fonts":
+            options["nerd-fonts"] = True
+        elif arg == "--stage-report":
+            options["stage-report"] = True
+        elif arg == "--profile":
+            # 合成するグリフをプロファイルのコードポイントに絞り込む (開発用)
+            options["profile"] = next(args, "")
+            if options["profile"] not in coverage_profiles.get_profile_names():
+                options["unknown-option"] = True
+                return
+        else:
+            options["unknown-option"] = True
+            return
+
+
+def generate_font(
+    src_style,
+    dst_style,
+    merged_style,
+    italic=False,
+    build_dir=BUILD_FONTS_DIR,
+    stream=False,
+):
+    """fontforge_script.generate_font() と同じ合成を fontTools のみで行う
+
+    stream を指定した場合は ttf を保存せず、合成した TTFont をそのまま返す
+    """
+    print(f"=== Generate {merged_style} style (fontTools) ===")
+    stage_profiler.start(bool(options.get("stage-report")))
+
+    # 合成するフォントを開き、EMを1000に揃える
+    dst_font = open_font(f"{SOURCE_FONTS_DIR}/{DST_FONT}{dst_style}.ttf")
+    src_font = open_font(
+        f"{SOURCE_FONTS_DIR}/{SRC_FONT}{src_style}.ttf",
+        reserved_names=set(dst_font.getGlyphOrder()),
+    )
+
+    # 合成時に優先するグリフを決めるため、各フォントのコードポイントを整理する
+    dst_cmap = dict(dst_font.getBestCmap())
+    src_cmap = dict(src_font.getBestCmap())
+    profile_codepoints = get_profile_codepoints()
+    if profile_codepoints is not None:
+        # プロファイルに含まれないグリフを以降の処理の対象から外す
+        # 日本語フォントは subset_font() で絞り込まれる
+        remove_codepoints(dst_font, dst_cmap, set(dst_cmap) - profile_codepoints)
+        src_cmap = {c: n for c, n in src_cmap.items() if c in profile_codepoints}
+    remove_codepoints(dst_font, dst_cmap, DELETE_DST_CODEPOINTS)
+    remove_duplicate_codepoints(src_cmap, dst_cmap)
+    nerd_font = None
+    if options.get("nerd-fonts"):
+        # Nerd Fontのグリフ幅は英数字の幅に合わせる
+        if options.get("half-width"):
+            half_width = HALF_WIDTH_12
+        else:
+            half_width = dst_font["hmtx"][dst_cmap[0x0030]][0]
+        nerd_font = open_nerd_font(half_width)
+        nerd_codepoints = list(nerd_font.getBestCmap())
+        remove_codepoints(dst_font, dst_cmap, nerd_codepoints)
+        for codepoint in nerd_codepoints:
+            src_cmap.pop(codepoint, None)
+
+    # 日本語フォントは合成に使うグリフと縦書きのルックアップのみに絞る
+    subset_font(src_font, src_cmap, JP_GSUB_FEATURES)
+
+    # いくつかのグリフ形状に調整を加える
+    src_transforms, dst_transforms = {}, {}
+    adjust_some_glyph(src_font, src_cmap, src_transforms)
+
+    # 日本語グリフの斜体を生成する
+    if italic:
+        transform_italic_glyphs(src_font, src_transforms)
+
+    # スラッシュ付きゼロ
+    if options.get("slashed-zero"):
+        slashed_zero(dst_font, dst_cmap)
+
+    # 3:5幅版との差分を調整する
+    if options.get("half-width"):
+        # 1:2 幅にする
+        transform_half_width(
+            src_font, dst_font, src_cmap, dst_cmap, src_transforms, dst_transforms
+        )
+    else:
+        # src_fontで半角幅(500)のグリフの幅を3:5になるよう調整する
+        width_500_to_600(src_font, src_transforms)
+
+    apply_transforms(src_font, src_transforms)
+    apply_transforms(dst_font, dst_transforms)
+
+    # 合成する
+    merged_cmap = dict(dst_cmap)
+    merge_font(dst_font, src_font, src_cmap, merged_cmap)
+    if nerd_font is not None:
+        merge_font(
+            dst_font, nerd_font, nerd_font.getBestCmap(), merged_cmap, copy_glyphs=True
+        )
+
+    if options.get("invisible-zenkaku-space"):
+        # 全角スペースを不可視化する
+        invisible_zenkaku_space(dst_font, merged_cmap)
+    else:
+        # 全角スペースを可視化する
+        visualize_zenkaku_space(dst_font, merged_cmap)
+
+    set_cmap(dst_font, merged_cmap)
+
+    # オプション毎の修飾子を追加する
+    variant = get_variant()
+
+    # メタデータを編集する
+    edit_meta_data(dst_font, merged_style, variant)
+
+    # ttfファイルに保存
+    if not stream:
+        with stage("save", dst_font):
+            dst_font.save(
+                f"{build_dir}/{FONTFORGE_PREFIX}{FONT_NAME}{variant}-{merged_style}.ttf"
+            )
+
+    stage_profiler.write_report(
+        f"{STAGE_REPORT_DIR}/{FONT_NAME}{variant}-{merged_style}_fonttools_merge.json",
+        f"{FONT_NAME}{variant}-{merged_style} (fonttools_merge.py)",
+    )
+    if stream:
+        return dst_font
+    dst_font.close()
+
+
+def get_variant() -> str:
+    """オプション毎の修飾子を返す"""
+    variant = HALF_WIDTH_STR if options.get("half-width") else ""
+    variant += SLASHED_ZERO_STR if options.get("slashed-zero") else ""
+    variant += (
+        INVISIBLE_ZENKAKU_SPACE_STR if options.get("invisible-zenkaku-space") else ""
+    )
+    variant += NERD_FONTS_STR if options.get("nerd-fonts") else ""
+    return variant
+
+
+@profile
+def open_font(path: str, reserved_names=(), name_suffix=None):
+    """フォントを開き、ヒント情報を削除してEMを1000にする
+
+    reserved_names と重複するグリフ名、または name_suffix を指定した場合は全てのグリフ名に
+    接尾辞を付け、合成先のグリフ名と重複しないようにする
+    """
+    font = TTFont(path)
+    # テーブルを読み込む前にグリフ名を変更することで、全てのテーブルに新しい名前が使われる
+    glyph_order = font.getGlyphOrder()
+    used_names = set(reserved_names)
+    renamed = []
+    for glyph_name in glyph_order:
+        if name_suffix is not None:
+            glyph_name = f"{glyph_name}{name_suffix}"
+        glyph_name = get_unique_name(glyph_name, used_names)
+        used_names.add(glyph_name)
+        renamed.append(glyph_name)
+    if renamed != glyph_order:
+        font.setGlyphOrder(renamed)
+
+    # ヒント情報と、内容が変わるため無効になる署名を削除する
+    fonttools_script.remove_hinting_ttfont(font)
+    if "DSIG" in font:
+        del font["DSIG"]
+    if font["head"].unitsPerEm != EM_ASCENT + EM_DESCENT:
+        scale_upem(font, EM_ASCENT + EM_DESCENT)
+    return font
+
+
+def get_unique_name(glyph_name: str, used_names) -> str:
+    """used_names と重複しないグリフ名を返す"""
+    unique_name = glyph_name
+    number = 1
+    while unique_name in used_names:
+        unique_name = f"{glyph_name}.{number}"
+        number += 1
+    return unique_name
+
+
+def get_profile_codepoints():
+    """--profile で指定したプロファイルのコードポイントを返す (絞り込まない場合は None)"""
+    return coverage_profiles.load_profile(
+        options.get("profile", coverage_profiles.FULL_PROFILE)
+    )
+
+
+def remove_codepoints(font, cmap: dict, codepoints):
+    """cmap からコードポイントを削除し、どのコードポイントからも参照されなくなったグリフを空にする
+
+    fontforge_script.py の clear_glyphs() に相当する
+    """
+    removed_names = {
+        cmap.pop(codepoint) for codepoint in codepoints if codepoint in cmap
+    }
+    glyf = font["glyf"]
+    for glyph_name in removed_names - set(cmap.values()):
+        glyf[glyph_name] = Glyph()
+        font["hmtx"][glyph_name] = (font["hmtx"][glyph_name][0], 0)
+
+
+def remove_duplicate_codepoints(src_cmap: dict, dst_cmap: dict):
+    """dst_cmap と重複するコードポイントを持つグリフのコードポイントを src_cmap から削除する
+
+    fontforge_script.delete_duplicate_glyphs() と同じく、1つでも重複するグリフは
+    他のコードポイントも含めてグリフごと削除する
+    """
+    duplicate_names = {
+        glyph_name
+        for codepoint, glyph_name in src_cmap.items()
+        if codepoint in dst_cmap
+    }
+    duplicates = [
+        codepoint
+        for codepoint, glyph_name in src_cmap.items()
+        if glyph_name in duplicate_names
+    ]
+    for codepoint in duplicates:
+        del src_cmap[codepoint]
+    # 合成結果のカバレッジの確認用に、それぞれのフォントから採用されるグリフ数を出力する
+    print(
+        f"Duplicate codepoints: {len(duplicates)} removed, "
+        f"src: {len(src_cmap)} codepoints, dst: {len(dst_cmap)} codepoints"
+    )
+
+
+@profile
+def subset_font(font, cmap: dict, layout_features: list):
+    """cmap のコードポイントと layout_features の GSUB から参照されるグリフのみに絞る"""
+    subset_options = subset.Options()
+    subset_options.layout_features = layout_features
+    subset_options.layout_scripts = ["*"]
+    subset_options.drop_tables += DROP_TABLES
+    subset_options.glyph_names = True
+    subset_options.notdef_outline = True
+    subset_options.hinting = False
+    subset_options.name_IDs = ["*"]
+    subset_options.name_languages = ["*"]
+    subset_options.prune_unicode_ranges = False
+    subsetter = subset.Subsetter(subset_options)
+    subsetter.populate(unicodes=list(cmap))
+    subsetter.subset(font)
+
+
+@profile
+def open_nerd_font(half_width: int):
+    """半角幅に合わせて調整済みの Nerd Font を開く"""
+    nerd_font = nerd_fonts.get(half_width)
+    if nerd_font is None:
+        nerd_font = normalize_nerd_font(half_width)
+        nerd_fonts[half_width] = nerd_font
+    return nerd_font
+
+
+def normalize_nerd_font(half_width: int):
+    """Nerd Font を開き、EM、グリフ名、位置、幅を合成先に合わせて調整する
+
+    fontforge_script.normalize_nerd_font() と同じ調整を行う
+    """
+    # Nerd Fontsのグリフ名をユニークにするため接尾辞を付ける
+    nerd_font = open_font(f"{SOURCE_FONTS_DIR}/{NERD_FONT}", name_suffix="-nf")
+    cmap = dict(nerd_font.getBestCmap())
+    profile_codepoints = get_profile_codepoints()
+    if profile_codepoints is not None:
+        cmap = {c: n for c, n in cmap.items() if c in profile_codepoints}
+    subset_font(nerd_font, cmap, [])
+    hmtx = nerd_font["hmtx"]
+    transforms = {}
+    for codepoint, glyph_name in sorted(cmap.items()):
+        if glyph_name in transforms:
+            continue
+        width = hmtx[glyph_name][0]
+        # Powerline Symbols の調整
+        if 0xE0B0 <= codepoint <= 0xE0D4:
+            if codepoint in POWERLINE_SHIFTS:
+                add_transform(
+                    transforms,
+                    glyph_name,
+                    Transform().translate(POWERLINE_SHIFTS[codepoint], 0),
+                )
+            # 位置と幅合わせ
+            if width < half_width:
+                add_transform(
+                    transforms,
+                    glyph_name,
+                    Transform().translate((half_width - width) / 2, 0),
+                )
+            elif width > half_width:
+                add_transform(
+                    transforms, glyph_name, Transform().scale(half_width / width, 1)
+                )
+            # グリフの高さ・位置を調整する
+            add_transform(transforms, glyph_name, Transform().scale(1, 1.14))
+            add_transform(transforms, glyph_name, Transform().translate(0, 21))
+        elif width < (EM_ASCENT + EM_DESCENT) * 0.6:
+            # 幅が狭いグリフは中央寄せとみなして調整する
+            add_transform(
+                transforms,
+                glyph_name,
+                Transform().translate((half_width - width) / 2, 0),
+            )
+        # 幅を設定
+        add_transform(transforms, glyph_name, Identity, half_width)
+    apply_transforms(nerd_font, transforms)
+    return nerd_font
+
+
+@profile
+def adjust_some_glyph(jp_font, jp_cmap: dict, transforms: dict):
+    """いくつかのグリフ形状に調整を加える"""
+    full_width = jp_font["hmtx"][jp_cmap[0x3042]][0]
+
+    # 全角括弧の開きを広くする
+    for codepoint in [0xFF08, 0xFF3B, 0xFF5B]:
+        add_transform(
+            transforms, jp_cmap[codepoint], Transform().translate(-180, 0), full_width
+        )
+    for codepoint in [0xFF09, 0xFF3D, 0xFF5D]:
+        add_transform(
+            transforms, jp_cmap[codepoint], Transform().translate(180, 0), full_width
+        )
+
+    # 幅が全角幅からずれている漢字を、中央を保ったまま全角幅にする
+    hmtx = jp_font["hmtx"]
+    ideograph_names = {
+        glyph_name
+        for codepoint, glyph_name in jp_cmap.items()
+        if any(start <= codepoint <= end for start, end in IDEOGRAPH_RANGES)
+    }
+    for glyph_name in sorted(ideograph_names):
+        width, lsb = hmtx[glyph_name]
+        if width != full_width:
+            add_transform(
+                transforms,
+                glyph_name,
+                Transform().translate((full_width - width) / 2, 0),
+            )
+            # 以降の幅によるグリフの選択で全角として扱うよう、幅はすぐに変更する
+            hmtx[glyph_name] = (full_width, lsb)
+
+
+@profile
+def transform_italic_glyphs(font, transforms: dict):
+    """全グリフを斜体に変換する"""
+    # 斜体の傾き
+    ITALIC_SLOPE = 9
+    skew = Transform().skew(math.radians(ITALIC_SLOPE), 0)
+    for glyph_name in font.getGlyphOrder():
+        add_transform(transforms, glyph_name, skew)
+
+
+@profile
+def slashed_zero(font, cmap: dict):
+    # "zero.zero" を "zero" にコピーする
+    font["glyf"][cmap[0x0030]] = copy.deepcopy(font["glyf"]["zero.zero"])
+    font["hmtx"][cmap[0x0030]] = font["hmtx"]["zero.zero"]
+
+
+@profile
+def width_500_to_600(font, transforms: dict):
+    """幅が500のグリフを600に変更する"""
+    for glyph_name in get_glyphs_by_width(font, 500):
+        # グリフ位置を50右にずらしてから幅を600にする
+        add_transform(transforms, glyph_name, Transform().translate(50, 0), 600)
+
+
+@profile
+def transform_half_width(
+    jp_font, eng_font, jp_cmap: dict, eng_cmap: dict, jp_transforms, eng_transforms
+):
+    """1:2幅になるように変換する"""
+    before_width_eng = eng_font["hmtx"][eng_cmap[0x0030]][0]
+    after_width_eng = HALF_WIDTH_12
+    scaled_width_eng = before_width_eng * ENG_GLYPH_SCALE_12
+    for glyph_name in get_glyphs_by_width(eng_font, before_width_eng):
+        # 縮小してからグリフ位置を調整し、幅を設定
+        add_transform(
+            eng_transforms, glyph_name, Transform().scale(ENG_GLYPH_SCALE_12, 1)
+        )
+        add_transform(
+            eng_transforms,
+            glyph_name,
+            Transform().translate(-(scaled_width_eng - after_width_eng) / 2, 0),
+            after_width_eng,
+        )
+
+    before_full_width_jp = jp_font["hmtx"][jp_cmap[0x3042]][0]
+    before_half_width_jp = before_full_width_jp / 2
+    after_width_jp = HALF_WIDTH_12 * 2
+    for glyph_name in get_glyphs_by_width(jp_font, before_half_width_jp):
+        # 英数字グリフと同じ幅にする
+        add_transform(
+            jp_transforms,
+            glyph_name,
+            Transform().translate(-(before_half_width_jp - after_width_eng) / 2, 0),
+            after_width_eng,
+        )
+    for glyph_name in get_glyphs_by_width(jp_font, before_full_width_jp):
+        # グリフ位置を調整してから幅を設定
+        add_transform(
+            jp_transforms,
+            glyph_name,
+            Transform().translate(-(before_full_width_jp - after_width_jp) / 2, 0),
+            after_width_jp,
+        )
+
+
+def get_glyphs_by_width(font, width) -> list:
+    """幅が width のグリフ名を返す"""
+    return [
+        glyph_name
+        for glyph_name, (advance, _) in font["hmtx"].metrics.items()
+        if advance == width
+    ]
+
+
+def add_transform(transforms: dict, glyph_name: str, matrix, width=None):
+    """グリフに適用する変換を transforms に追加する
+
+    同じグリフに複数回追加した場合は、追加した順に適用する1つの変換行列に合成する。
+    width を指定した場合は変換後にグリフの幅を width にする。
+    """
+    current_matrix, current_width = transforms.get(glyph_name, (Identity, None))
+    transforms[glyph_name] = (
+        matrix.transform(current_matrix),
+        current_width if width is None else width,
+    )
+
+
+@profile
+def apply_transforms(font, transforms: dict):
+    """add_transform で追加した変換と幅の変更を、グリフ毎に1回でまとめて適用する
+
+    アウトラインの座標を変換し、hmtx の幅と左サイドベアリングを更新する
+    """
+    glyf = font["glyf"]
+    hmtx = font["hmtx"]
+    # 複合グリフは参照先と異なる変換を受け得るため、どのグリフも変換する前に分解しておく
+    for glyph_name, (matrix, _) in transforms.items():
+        if matrix != Identity and glyf[glyph_name].isComposite():
+            decompose_glyph(glyf, glyph_name)
+    for glyph_name, (matrix, width) in transforms.items():
+        glyph = glyf[glyph_name]
+        if matrix != Identity:
+            transform_glyph(glyph, matrix)
+        advance, lsb = hmtx[glyph_name]
+        hmtx[glyph_name] = (advance if width is None else width, lsb)
+    # 左サイドベアリングは参照先のグリフの変換後に求める
+    for glyph_name in transforms:
+        glyph = glyf[glyph_name]
+        glyph.recalcBounds(glyf)
+        lsb = glyph.xMin if glyph.numberOfContours != 0 else 0
+        hmtx[glyph_name] = (hmtx[glyph_name][0], lsb)
+    transforms.clear()
+
+
+def decompose_glyph(glyf, glyph_name: str):
+    """複合グリフを、コンポーネントの輪郭を展開した単純なグリフに置き換える"""
+    coordinates, end_points, flags = glyf[glyph_name].getCoordinates(glyf)
+    glyph = Glyph()
+    glyph.numberOfContours = len(end_points)
+    glyph.coordinates = coordinates
+    glyph.endPtsOfContours = list(end_points)
+    glyph.flags = array("B", (flag & flagOnCurve for flag in flags))
+    glyph.program = ttProgram.Program()
+    glyph.program.fromBytecode(b"")
+    glyf[glyph_name] = glyph
+
+
+def transform_glyph(glyph, matrix):
+    """単純なグリフの座標を変換する (複合グリフは decompose_glyph() で分解しておくこと)"""
+    if glyph.numberOfContours > 0:
+        glyph.coordinates.transform(((matrix.xx, matrix.xy), (matrix.yx, matrix.yy)))
+        glyph.coordinates.translate((matrix.dx, matrix.dy))
+        glyph.coordinates.toInt()
+
+
+@profile
+def merge_font(
+    dst_font, src_font, src_cmap: dict, merged_cmap: dict, copy_glyphs=False
+):
+    """src_font のグリフ、cmap、GSUB を dst_font に追加する
+
+    グリフ名は open_font() で重複しないようにしておくこと。
+    キャッシュしたフォントのように src_font を使い回す場合は copy_glyphs を指定する
+    """
+    # glyf にグリフを追加するとグリフの並び順も変わるため、追加前の並び順をコピーしておく
+    glyph_order = list(dst_font.getGlyphOrder())
+    # 先頭の .notdef は合成先のものを使う
+    new_names = src_font.getGlyphOrder()[1:]
+    dst_glyf, src_glyf = dst_font["glyf"], src_font["glyf"]
+    dst_hmtx, src_hmtx = dst_font["hmtx"], src_font["hmtx"]
+    for glyph_name in new_names:
+        glyph = src_glyf[glyph_name]
+        dst_glyf[glyph_name] = copy.deepcopy(glyph) if copy_glyphs else glyph
+        dst_hmtx[glyph_name] = src_hmtx[glyph_name]
+    glyph_order = glyph_order + new_names
+    dst_font.setGlyphOrder(glyph_order)
+    dst_glyf.setGlyphOrder(glyph_order)
+    merged_cmap.update(
+        (codepoint, glyph_name)
+        for codepoint, glyph_name in src_cmap.items()
+        if glyph_name in dst_hmtx.metrics
+    )
+
+    if "GSUB" in src_font:
+        merge_gsub(dst_font, src_font)
+    if "GDEF" in src_font and "GDEF" in dst_font:
+        merge_glyph_class_def(dst_font, src_font)
+
+
+def merge_gsub(dst_font, src_font):
+    """src_font の GSUB のルックアップと機能を dst_font の GSUB に追加する"""
+    if "GSUB" not in dst_font:
+        dst_font["GSUB"] = src_font["GSUB"]
+        return
+    dst = dst_font["GSUB"].table
+    src = src_font["GSUB"].table
+    lookup_offset = len(dst.LookupList.Lookup)
+    feature_offset = len(dst.FeatureList.FeatureRecord)
+
+    # 文脈依存のルックアップから参照するルックアップの番号をずらす
+    lookup_indices = [None] * lookup_offset + list(range(len(src.LookupList.Lookup)))
+    for lookup in src.LookupList.Lookup:
+        lookup.subset_lookups(lookup_indices)
+        dst.LookupList.Lookup.append(lookup)
+    for feature_record in src.FeatureList.FeatureRecord:
+        feature_record.Feature.LookupListIndex = [
+            index + lookup_offset for index in feature_record.Feature.LookupListIndex
+        ]
+        dst.FeatureList.FeatureRecord.append(feature_record)
+
+    dst_scripts = {record.ScriptTag: record for record in dst.ScriptList.ScriptRecord}
+    lang_systems = {
+        id(lang_sys): lang_sys
+        for record in src.ScriptList.ScriptRecord
+        for lang_sys in get_lang_systems(record.Script)
+    }
+    for lang_sys in lang_systems.values():
+        lang_sys.FeatureIndex = [
+            index + feature_offset for index in lang_sys.FeatureIndex
+        ]
+    for src_record in src.ScriptList.ScriptRecord:
+        dst_record = dst_scripts.get(src_record.ScriptTag)
+        if dst_record is None:
+            dst.ScriptList.ScriptRecord.append(src_record)
+            continue
+        merge_script(dst_record.Script, src_record.Script)
+
+    # スクリプト、言語はタグ順に並べる必要がある
+    dst.ScriptList.ScriptRecord.sort(key=lambda record: record.ScriptTag)
+    for record in dst.ScriptList.ScriptRecord:
+        record.Script.LangSysRecord.sort(key=lambda record: record.LangSysTag)
+
+
+def get_lang_systems(script) -> list:
+    """スクリプトに含まれる言語システムを返す"""
+    lang_systems = [record.LangSys for record in script.LangSysRecord]
+    if script.DefaultLangSys is not None:
+        lang_systems.append(script.DefaultLangSys)
+    return lang_systems
+
+
+def merge_script(dst_script, src_script):
+    """src_script の言語システムの機能を dst_script に追加する"""
+    if src_script.DefaultLangSys is not None:
+        if dst_script.DefaultLangSys is None:
+            dst_script.DefaultLangSys = src_script.DefaultLangSys
+        else:
+            dst_script.DefaultLangSys.FeatureIndex = sorted(
+                dst_script.DefaultLangSys.FeatureIndex
+                + src_script.DefaultLangSys.FeatureIndex
+            )
+    dst_lang_systems = {
+        record.LangSysTag: record.LangSys for record in dst_script.LangSysRecord
+    }
+    for src_record in src_script.LangSysRecord:
+        dst_lang_sys = dst_lang_systems.get(src_record.LangSysTag)
+        if dst_lang_sys is None:
+            dst_script.LangSysRecord.append(src_record)
+        else:
+            dst_lang_sys.FeatureIndex = sorted(
+                dst_lang_sys.FeatureIndex + src_record.LangSys.FeatureIndex
+            )
+
+
+def merge_glyph_class_def(dst_font, src_font):
+    """src_font の GDEF のグリフクラスを dst_font に追加する"""
+    dst = dst_font["GDEF"].table
+    src = src_font["GDEF"].table
+    if src.GlyphClassDef is None or dst.GlyphClassDef is None:
+        return
+    dst_glyph_names = dst_font["hmtx"].metrics
+    dst.GlyphClassDef.classDefs.update(
+        (glyph_name, glyph_class)
+        for glyph_name, glyph_class in src.GlyphClassDef.classDefs.items()
+        if glyph_name in dst_glyph_names
+    )
+
+
+@profile
+def invisible_zenkaku_space(font, cmap: dict):
+    """全角スペースを不可視化する"""
+    # U+3000 に幅を設定し空白を作る
+    add_glyph(font, cmap, 0x3000, "uni3000", Glyph(), font["hmtx"][cmap[0x3042]][0])
+
+
+@profile
+def visualize_zenkaku_space(font, cmap: dict):
+    """全角スペースを可視化する"""
+    # 全角スペースを差し替え
+    width_to = font["hmtx"][cmap[0x3042]][0]
+    glyph, width_from = read_sfd_glyph(
+        f"{SOURCE_FONTS_DIR}/{IDEOGRAPHIC_SPACE}", "uni3000"
+    )
+    glyph_name = add_glyph(font, cmap, 0x3000, "uni3000", glyph, width_to)
+    # 幅を設定し位置調整
+    transforms = {}
+    add_transform(
+        transforms, glyph_name, Transform().translate((width_to - width_from) / 2, 0)
+    )
+    apply_transforms(font, transforms)
+
+
+def add_glyph(font, cmap: dict, codepoint: int, glyph_name: str, glyph, width):
+    """グリフを追加して codepoint に割り当て、追加したグリフ名を返す"""
+    glyph_order = list(font.getGlyphOrder())
+    glyph_name = get_unique_name(glyph_name, font["hmtx"].metrics)
+    font["glyf"][glyph_name] = glyph
+    glyph.recalcBounds(font["glyf"])
+    lsb = glyph.xMin if glyph.numberOfContours != 0 else 0
+    font["hmtx"][glyph_name] = (width, lsb)
+    glyph_order = glyph_order + [glyph_name]
+    font.setGlyphOrder(glyph_order)
+    font["glyf"].setGlyphOrder(glyph_order)
+    cmap[codepoint] = glyph_name
+    return glyph_name
+
+
+def read_sfd_glyph(path: str, glyph_name: str):
+    """FontForge の sfd ファイルからグリフのアウトラインと幅を読み込む
+
+    SplineSet の直線 (l) と曲線 (c) のみに対応する。
+    2次曲線のレイヤーでは制御点が重複した3次曲線として記録されているため、2次曲線に戻す。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        sfd = f.read()
+    matched = re.search(
+        rf"^StartChar: {re.escape(glyph_name)}\n(.*?)^EndChar",
+        sfd,
+        flags=re.MULTILINE | re.DOTALL,
+    )
+    if matched is None:
+        raise ValueError(f"{path}: glyph {glyph_name} not found")
+    char = matched.group(1)
+    width = int(re.search(r"^Width: (-?\d+)", char, flags=re.MULTILINE).group(1))
+    spline_set = re.search(
+        r"^SplineSet\n(.*?)^EndSplineSet", char, flags=re.MULTILINE | re.DOTALL
+    )
+
+    pen = TTGlyphPen(None)
+    cu2qu_pen = Cu2QuPen(pen, max_err=1.0)
+    contour_open = False
+    for line in spline_set.group(1).splitlines() if spline_set else []:
+        tokens = line.split()
+        values = [float(token) for token in tokens[:-2]]
+        points = list(zip(values[0::2], values[1::2]))
+        if tokens[-2] == "m":
+            if contour_open:
+                cu2qu_pen.closePath()
+            cu2qu_pen.moveTo(points[0])
+            contour_open = True
+        elif tokens[-2] == "l":
+            cu2qu_pen.lineTo(points[0])
+        elif tokens[-2] == "c":
+            if points[0] == points[1]:
+                cu2qu_pen.qCurveTo(points[0], points[2])
+            else:
+                cu2qu_pen.curveTo(*points)
+        else:
+            raise ValueError(f"{path}: unsupported spline command {line}")
+    if contour_open:
+        cu2qu_pen.closePath()
+    return pen.glyph(), width
+
+
+def set_cmap(font, cmap: dict):
+    """cmap の Unicode のサブテーブルを cmap の内容で作り直す
+
+    BMP は format 4、BMP 外のコードポイントがある場合は format 12 にも出力する
+    """
+    tables = [
+        table
+        for table in font["cmap"].tables
+        if not table.isUnicode() or table.format == 14
+    ]
+    bmp = {codepoint: name for codepoint, name in cmap.items() if codepoint <= 0xFFFF}
+    subtables = [(4, 0, 3, bmp), (4, 3, 1, bmp)]
+    if len(bmp) != len(cmap):
+        subtables += [(12, 0, 4, cmap), (12, 3, 10, cmap)]
+    for table_format, platform_id, encoding_id, mapping in subtables:
+        table = CmapSubtable.newSubtable(table_format)
+        table.platformID = platform_id
+        table.platEncID = encoding_id
+        table.language = 0
+        table.cmap = dict(mapping)
+        tables.append(table)
+    font["cmap"].tables = sorted(
+        tables, key=lambda table: (table.platformID, table.platEncID, table.format)
+    )
+
+
+@profile
+def edit_meta_data(font, weight: str, variant: str):
+    """フォント内のメタデータを fontforge_script.edit_meta_data() と同じ内容にする"""
+    name = font["name"]
+    # FontForge は edit_meta_data() で設定しない名前を出力しないため、同じものに絞る
+    name.names = [
+        record
+        for record in name.names
+        if record.nameID in (0, 1, 2, 3, 4, 5, 6, 13, 14)
+    ]
+    # Unique ID は fix_name_table_ttfont() で FontForge と同じ形式のものを Windows 向けに設定する
+    name.names = [
+        record
+        for record in name.names
+        if record.nameID != 3 or (record.platformID, record.platEncID) == (3, 1)
+    ]
+    fonttools_script.fix_name_table_ttfont(name, weight, variant)
+    fonttools_script.fix_metrics_ttfont(font)
+    font["OS/2"].recalcUnicodeRanges(font)
+
+
+if __name__ == "__main__":
+    main()
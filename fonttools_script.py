@@ -1,121 +1,346 @@
 #!/bin/env python3
 
 import configparser
+import functools
 import glob
+import hashlib
+import io
+import multiprocessing
 import os
+import re
+import sys
+import time
+import traceback
 import xml.etree.ElementTree as ET
+from array import array
+from decimal import ROUND_HALF_UP, Decimal
+from types import MappingProxyType
 
 import fontTools.ttx
+from fontTools import subset
+from fontTools.ttLib import TTFont, woff2
+from fontTools.ttLib.tables._g_l_y_f import (
+    ROUND_XY_TO_GRID,
+    USE_MY_METRICS,
+    Glyph,
+    GlyphComponent,
+)
+
+import coverage_profiles
+import stage_profiler
+from font_settings import COPYRIGHT, LICENSE, LICENSE_URL, OS2_CODEPAGES
+from stage_profiler import profile, stage
 
 # iniファイルを読み込む
 settings = configparser.ConfigParser()
 settings.read("build.ini", encoding="utf-8")
 
+VERSION = settings.get("DEFAULT", "VERSION")
 FONT_NAME = settings.get("DEFAULT", "FONT_NAME")
+VENDER_NAME = settings.get("DEFAULT", "VENDER_NAME")
 INPUT_PREFIX = settings.get("DEFAULT", "FONTFORGE_PREFIX")
 OUTPUT_PREFIX = settings.get("DEFAULT", "FONTTOOLS_PREFIX")
 BUILD_FONTS_DIR = settings.get("DEFAULT", "BUILD_FONTS_DIR")
 HALF_WIDTH_STR = settings.get("DEFAULT", "HALF_WIDTH_STR")
 HALF_WIDTH_12 = int(settings.get("DEFAULT", "HALF_WIDTH_12"))
 FULL_WIDTH_35 = int(settings.get("DEFAULT", "FULL_WIDTH_35"))
+OS2_ASCENT = int(settings.get("DEFAULT", "OS2_ASCENT"))
+OS2_DESCENT = int(settings.get("DEFAULT", "OS2_DESCENT"))
 
-xml_cmap = None
+ADD_CMAP_CSV = "add_cmap.csv"
+# 各処理の計測結果の出力先
+STAGE_REPORT_DIR = f"{BUILD_FONTS_DIR}/stage_report"
+
+# ヒント情報のテーブル (ttfautohint --dehint で削除されるもの)
+HINTING_TABLES = ("fpgm", "prep", "cvt ", "hdmx", "LTSH", "VDMX")
+# Web フォント (--web) の出力先 (各フォントのディレクトリからの相対パス)
+WEB_FONTS_DIR = "web"
+# Web フォントの unicode-range 毎のサブセット
+# コードポイントは先に定義したサブセットに含め、どれにも含まれないものは "rest" に含める
+WEB_SUBSETS = ("latin", "kana", "jis1", "jis2", "nerd", "rest")
+
+options = {}
 
 
 def main():
-    global xml_cmap
-    fix_font_tables("Regular")
-    fix_font_tables("Bold")
-    xml_cmap = None
-    fix_font_tables("RegularItalic")
-    fix_font_tables("BoldItalic")
+    # オプション判定
+    get_options()
+    if options.get("unknown-option"):
+        usage()
+        return
+
+    if options.get("restamp"):
+        # ビルド済みのフォントのメタデータのみを書き換える
+        for filename in options.get("files") or get_built_font_paths():
+            restamp_font(filename)
+        return
+
+    if options.get("web"):
+        # ビルド済みのフォントから Web フォントを生成する
+        if not woff2.haveBrotli:
+            print("Error: brotli module is not available, run pip install brotli")
+            sys.exit(1)
+        with multiprocessing.Pool(processes=options.get("jobs")) as pool:
+            generate_web_fonts(options.get("files") or get_built_font_paths(), pool)
+        return
 
+    errors = fix_font_files(
+        options.get("files")
+        or sorted(glob.glob(f"{BUILD_FONTS_DIR}/{INPUT_PREFIX}{FONT_NAME}*.ttf")),
+        jobs=options.get("jobs"),
+    )
+    for error in errors:
+        print(f"Error: {error}")
+    if errors:
+        sys.exit(1)
+
+
+def usage():
+    print(
+        f"Usage: {sys.argv[0]} [--ttx] [--stage-report] [--dedup-outlines] [--jobs N]"
+        f" [{INPUT_PREFIX}{FONT_NAME}*.ttf ...]"
+    )
+    print(f"       {sys.argv[0]} --restamp [{FONT_NAME}*.ttf ...]")
+    print(f"       {sys.argv[0]} --web [{FONT_NAME}*.ttf ...]")
+
+
+def get_options():
+    """オプションを取得する"""
+
+    global options
+
+    args = iter(sys.argv[1:])
+    for arg in args:
+        # オプション判定
+        if arg == "--ttx":
+            # ttx (XML) を経由して編集する従来の方式を使う
+            options["ttx"] = True
+        elif arg == "--stage-report":
+            # 各処理の処理時間・メモリ使用量・グリフ数を計測する
+            options["stage-report"] = True
+        elif arg == "--dedup-outlines":
+            # 同じ輪郭のグリフを複合グリフにしてファイルサイズを減らす
+            options["dedup-outlines"] = True
+        elif arg == "--restamp":
+            # ビルド済みのフォントのメタデータを build.ini の値で書き換える
+            options["restamp"] = True
+        elif arg == "--web":
+            # ビルド済みのフォントから WOFF2 と unicode-range 毎のサブセット、CSS を生成する
+            options["web"] = True
+        elif arg == "--jobs":
+            # ワーカープロセス数 (既定値は CPU コア数)
+            jobs = next(args, "")
+            if not jobs.isdecimal() or int(jobs) < 1:
+                options["unknown-option"] = True
+                return
+            options["jobs"] = int(jobs)
+        elif not arg.startswith("-"):
+            # 処理するファイル (省略時はビルドディレクトリ内の全てのファイル)
+            options.setdefault("files", []).append(arg)
+        else:
+            options["unknown-option"] = True
+            return
+
+
+def get_built_font_paths() -> list:
+    """ビルド済みのフォントのパスを返す"""
+    return sorted(
+        glob.glob(f"{BUILD_FONTS_DIR}/{FONT_NAME}*.ttf")
+        + glob.glob(f"{BUILD_FONTS_DIR}/{FONT_NAME}*/{FONT_NAME}*.ttf")
+    )
+
+
+def fix_font_files(paths: list, jobs: int = None) -> list:
+    """フォントテーブルの編集をファイル毎のジョブとしてプロセスプールで実行する
+
+    エラー内容のリストを返す
+    """
+    # add_cmap.csv はワーカーから共有できるよう、プールを作る前に読み込んでおく
+    load_add_cmap()
+    file_jobs = [
+        (
+            path,
+            bool(options.get("ttx")),
+            bool(options.get("stage-report")),
+            bool(options.get("dedup-outlines")),
+        )
+        for path in paths
+    ]
+    with multiprocessing.Pool(processes=jobs) as pool:
+        results = pool.map(run_fix_font_job, file_jobs, chunksize=1)
+    return [e for e in results if e]
+
+
+def run_fix_font_job(job):
+    """1ファイル分のフォントテーブルを編集し、中間ファイルを削除する"""
+    path, ttx, stage_report, dedup_outlines = job
+    try:
+        fix_font_file(
+            path, ttx=ttx, stage_report=stage_report, dedup_outlines=dedup_outlines
+        )
+    except Exception:
+        return f"{path}\n{traceback.format_exc()}"
     # 一時ファイルを削除
-    # スタイル部分はワイルドカードで指定
-    for filename in glob.glob(f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}*"):
-        os.remove(filename)
-    for filename in glob.glob(f"{BUILD_FONTS_DIR}/{INPUT_PREFIX}{FONT_NAME}*"):
+    # スタイル部分まで含めて指定し、他のジョブのファイルは消さない
+    stem = os.path.splitext(os.path.basename(path))[0].replace(INPUT_PREFIX, "", 1)
+    for filename in glob.glob(
+        f"{glob.escape(os.path.dirname(path) or '.')}/{OUTPUT_PREFIX}{stem}[._]*"
+    ):
         os.remove(filename)
+    os.remove(path)
+    return None
+
+
+def fix_font_file(
+    path: str,
+    ttx: bool = False,
+    stage_report: bool = False,
+    dedup_outlines: bool = False,
+):
+    """FontForge が出力したフォント1ファイル分のテーブルを編集する
+
+    出力先は path と同じディレクトリの {FONT_NAME}{variant}-{style}.ttf とする
+    """
+    # ファイル名から variant, style を取得
+    matched = re.fullmatch(
+        rf"{re.escape(INPUT_PREFIX + FONT_NAME)}(.*)-([^-]+)\.ttf",
+        os.path.basename(path),
+    )
+    if matched is None:
+        raise ValueError(f"{path} is not a {INPUT_PREFIX}{FONT_NAME}*.ttf file")
+    variant, style = matched.groups()
+    build_dir = os.path.dirname(path) or "."
 
+    stage_profiler.start(stage_report)
 
-def fix_font_tables(style):
-    """フォントテーブルを編集する"""
+    if ttx:
+        fix_font_tables_ttx(style, variant, build_dir, dedup_outlines)
+    else:
+        fix_font_tables_ttfont(path, style, variant, build_dir, dedup_outlines)
 
-    global xml_cmap
+    write_stage_report(style, variant)
 
-    # ファイルをパターンで指定
-    filenames = glob.glob(f"{BUILD_FONTS_DIR}/{INPUT_PREFIX}{FONT_NAME}*-{style}.ttf")
-    # ファイルが見つからない or 複数見つかった場合はエラー
-    if len(filenames) == 0:
-        print(f"Error: {INPUT_PREFIX}{FONT_NAME}*-{style}.ttf not found")
-        return
-    elif len(filenames) > 1:
-        print(f"Error: {INPUT_PREFIX}{FONT_NAME}*-{style}.ttf is not unique")
-        return
-    filename = (
-        filenames[0]
-        .replace(f"{BUILD_FONTS_DIR}\\", "")
-        .replace(f"{BUILD_FONTS_DIR}/", "")
-    )
-    # ファイル名から variant を取得
-    variant = filename.replace(f"{INPUT_PREFIX}{FONT_NAME}", "").replace(
-        f"-{style}.ttf", ""
+
+def fix_font_stream(
+    source,
+    style: str,
+    variant: str,
+    build_dir: str,
+    stage_report: bool = False,
+    dedup_outlines: bool = False,
+):
+    """合成結果を中間ファイルを経由せずに受け取り、最終的なフォントのみを出力する
+
+    source には合成結果の TTFont またはファイルオブジェクト (BytesIO 等) を渡す
+    """
+    stage_profiler.start(stage_report)
+    fix_font_tables_ttfont(source, style, variant, build_dir, dedup_outlines)
+    write_stage_report(style, variant)
+
+
+def fix_font_tables_ttfont(
+    source, style: str, variant: str, build_dir: str, dedup_outlines: bool = False
+):
+    """フォントを開き、各テーブルを直接編集して1回で保存する
+
+    source にはファイルのパス、ファイルオブジェクト、TTFont のいずれかを渡す
+    """
+    if isinstance(source, TTFont):
+        font = source
+    else:
+        with stage("TTFont"):
+            font = TTFont(source)
+    remove_hinting_ttfont(font)
+    if dedup_outlines:
+        dedup_outlines_ttfont(font)
+    fix_os2_table_ttfont(font["OS/2"], style, flag_hw=HALF_WIDTH_STR in variant)
+    fix_post_table_ttfont(font["post"])
+    fix_cmap_table_ttfont(font)
+    with stage("save", font):
+        font.save(f"{build_dir}/{FONT_NAME}{variant}-{style}.ttf")
+    font.close()
+
+
+def write_stage_report(style: str, variant: str):
+    """fonttools_script.py の処理の計測結果を出力する"""
+    stage_profiler.write_report(
+        f"{STAGE_REPORT_DIR}/{FONT_NAME}{variant}-{style}_fonttools.json",
+        f"{FONT_NAME}{variant}-{style} (fonttools_script.py)",
     )
 
+
+def fix_font_tables_ttx(
+    style: str,
+    variant: str,
+    build_dir: str = BUILD_FONTS_DIR,
+    dedup_outlines: bool = False,
+):
+    """ttxファイルを経由してフォントテーブルを編集する"""
+
+    # ヒント情報を削除する
+    with stage("dehint"):
+        font = TTFont(f"{build_dir}/{INPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttf")
+        remove_hinting_ttfont(font)
+        if dedup_outlines:
+            dedup_outlines_ttfont(font)
+        font.save(f"{build_dir}/{INPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttf")
+        font.close()
+
     # OS/2, post テーブルのみのttxファイルを出力
-    xml = dump_ttx(style, variant)
+    xml = dump_ttx(style, variant, build_dir)
     # OS/2 テーブルを編集
     fix_os2_table(xml, style, flag_hw=HALF_WIDTH_STR in variant)
     # post テーブルを編集
     fix_post_table(xml)
 
-    # 処理が重いので初回だけ実行して結果をキャッシュする
-    if xml_cmap is None:
-        # cmap テーブルのみのttxファイルを出力
-        xml_cmap = dump_ttx_cmap(style, variant)
-        # cmap テーブルを編集
-        fix_cmap_table(xml_cmap)
+    # cmap テーブルのみのttxファイルを出力
+    xml_cmap = dump_ttx_cmap(style, variant, build_dir)
+    # cmap テーブルを編集
+    fix_cmap_table(xml_cmap)
 
     # ttxファイルを上書き保存
     xml.write(
-        f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttx",
+        f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttx",
         encoding="utf-8",
         xml_declaration=True,
     )
     xml_cmap.write(
-        f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_cmap.ttx",
+        f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_cmap.ttx",
         encoding="utf-8",
         xml_declaration=True,
     )
 
     # ttxファイルをttfファイルに適用
-    fontTools.ttx.main(
-        [
-            "-o",
-            f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_os2_post.ttf",
-            "-m",
-            f"{BUILD_FONTS_DIR}/{INPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttf",
-            f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttx",
-        ]
-    )
-    fontTools.ttx.main(
-        [
-            "-o",
-            f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_os2_post_cmap.ttf",
-            "-m",
-            f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_os2_post.ttf",
-            f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_cmap.ttx",
-        ]
-    )
+    with stage("ttx -m (OS/2, post)"):
+        fontTools.ttx.main(
+            [
+                "-o",
+                f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_os2_post.ttf",
+                "-m",
+                f"{build_dir}/{INPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttf",
+                f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttx",
+            ]
+        )
+    with stage("ttx -m (cmap)"):
+        fontTools.ttx.main(
+            [
+                "-o",
+                f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_os2_post_cmap.ttf",
+                "-m",
+                f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_os2_post.ttf",
+                f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_cmap.ttx",
+            ]
+        )
 
     # ファイル名を変更
     os.rename(
-        f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_os2_post_cmap.ttf",
-        f"{BUILD_FONTS_DIR}/{FONT_NAME}{variant}-{style}.ttf",
+        f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_os2_post_cmap.ttf",
+        f"{build_dir}/{FONT_NAME}{variant}-{style}.ttf",
     )
 
 
-def dump_ttx(style: str, variant: str) -> ET:
+@profile
+def dump_ttx(style: str, variant: str, build_dir: str = BUILD_FONTS_DIR) -> ET:
     """OS/2, post テーブルのみのttxファイルを出力"""
     fontTools.ttx.main(
         [
@@ -125,17 +350,20 @@ def dump_ttx(style: str, variant: str) -> ET:
             "post",
             "-f",
             "-o",
-            f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttx",
-            f"{BUILD_FONTS_DIR}/{INPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttf",
+            f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttx",
+            f"{build_dir}/{INPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttf",
         ]
     )
 
     return ET.parse(
-        f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttx"
+        f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttx"
     )
 
 
-def dump_ttx_cmap(style: str, variant: str) -> ET:
+@profile
+def dump_ttx_cmap(
+    style: str, variant: str, build_dir: str = BUILD_FONTS_DIR
+) -> ET:
     """cmap テーブルのみのttxファイルを出力"""
     fontTools.ttx.main(
         [
@@ -143,29 +371,23 @@ def dump_ttx_cmap(style: str, variant: str) -> ET:
             "cmap",
             "-f",
             "-o",
-            f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_cmap.ttx",
-            f"{BUILD_FONTS_DIR}/{INPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttf",
+            f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_cmap.ttx",
+            f"{build_dir}/{INPUT_PREFIX}{FONT_NAME}{variant}-{style}.ttf",
         ]
     )
 
     return ET.parse(
-        f"{BUILD_FONTS_DIR}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_cmap.ttx"
+        f"{build_dir}/{OUTPUT_PREFIX}{FONT_NAME}{variant}-{style}_cmap.ttx"
     )
 
 
-def fix_os2_table(xml: ET, style: str, flag_hw: bool = False):
-    """OS/2 テーブルを編集する"""
-    # xAvgCharWidthを編集
-    # タグ形式: <xAvgCharWidth value="1000"/>
+def get_os2_values(style: str, flag_hw: bool = False):
+    """OS/2 テーブルに設定する xAvgCharWidth, fsSelection, panose の値を返す"""
     if flag_hw:
         x_avg_char_width = HALF_WIDTH_12
     else:
         x_avg_char_width = FULL_WIDTH_35
-    for elem in xml.iter("xAvgCharWidth"):
-        elem.set("value", str(x_avg_char_width))
 
-    # fsSelectionを編集
-    # タグ形式: <fsSelection value="00000000 11000000" />
     # スタイルに応じたビットを立てる
     if style == "Regular":
         fs_selection = "00000001 01000000"
@@ -176,24 +398,6 @@ def fix_os2_table(xml: ET, style: str, flag_hw: bool = False):
     elif style == "BoldItalic":
         fs_selection = "00000001 00100001"
 
-    if fs_selection:
-        for elem in xml.iter("fsSelection"):
-            elem.set("value", fs_selection)
-
-    # panoseを編集
-    # タグ形式:
-    # <panose>
-    #   <bFamilyType value="2" />
-    #   <bSerifStyle value="11" />
-    #   <bWeight value="6" />
-    #   <bProportion value="9" />
-    #   <bContrast value="6" />
-    #   <bStrokeVariation value="3" />
-    #   <bArmStyle value="0" />
-    #   <bLetterForm value="2" />
-    #   <bMidline value="0" />
-    #   <bXHeight value="4" />
-    # </panose>
     if style == "Regular" or style == "Italic":
         bWeight = 5
     else:
@@ -225,11 +429,57 @@ def fix_os2_table(xml: ET, style: str, flag_hw: bool = False):
             "bXHeight": 7,
         }
 
+    return x_avg_char_width, fs_selection, panose
+
+
+@profile
+def fix_os2_table(xml: ET, style: str, flag_hw: bool = False):
+    """OS/2 テーブルを編集する"""
+    x_avg_char_width, fs_selection, panose = get_os2_values(style, flag_hw)
+
+    # xAvgCharWidthを編集
+    # タグ形式: <xAvgCharWidth value="1000"/>
+    for elem in xml.iter("xAvgCharWidth"):
+        elem.set("value", str(x_avg_char_width))
+
+    # fsSelectionを編集
+    # タグ形式: <fsSelection value="00000000 11000000" />
+    if fs_selection:
+        for elem in xml.iter("fsSelection"):
+            elem.set("value", fs_selection)
+
+    # panoseを編集
+    # タグ形式:
+    # <panose>
+    #   <bFamilyType value="2" />
+    #   <bSerifStyle value="11" />
+    #   <bWeight value="6" />
+    #   <bProportion value="9" />
+    #   <bContrast value="6" />
+    #   <bStrokeVariation value="3" />
+    #   <bArmStyle value="0" />
+    #   <bLetterForm value="2" />
+    #   <bMidline value="0" />
+    #   <bXHeight value="4" />
+    # </panose>
     for key, value in panose.items():
         for elem in xml.iter(key):
             elem.set("value", str(value))
 
 
+@profile
+def fix_os2_table_ttfont(os2, style: str, flag_hw: bool = False):
+    """OS/2 テーブルを直接編集する"""
+    x_avg_char_width, fs_selection, panose = get_os2_values(style, flag_hw)
+
+    os2.xAvgCharWidth = x_avg_char_width
+    if fs_selection:
+        os2.fsSelection = int(fs_selection.replace(" ", ""), 2)
+    for key, value in panose.items():
+        setattr(os2.panose, key, value)
+
+
+@profile
 def fix_post_table(xml: ET):
     """post テーブルを編集する"""
     # isFixedPitchを編集
@@ -239,29 +489,451 @@ def fix_post_table(xml: ET):
         elem.set("value", str(is_fixed_pitch))
 
 
+@profile
+def fix_post_table_ttfont(post):
+    """post テーブルを直接編集する"""
+    post.isFixedPitch = 0
+
+
+@profile
 def fix_cmap_table(xml: ET):
     """cmap テーブルを編集する"""
     # cmap_format_4, cmap_format_12 タグ内の末尾に add_cmap.csv の内容を追加
-    # add_cmap.csv の内容は以下の形式
-    # code,name,description
-    for elem in xml.iter("cmap_format_4"):
-        with open("add_cmap.csv", "r") as f:
-            for line in f:
-                # "#" で始まる行はコメント扱い
-                if line.startswith("#"):
+    add_cmap = load_add_cmap()
+    for tag in ["cmap_format_4", "cmap_format_12"]:
+        for elem in xml.iter(tag):
+            for code, name in add_cmap.items():
+                if tag == "cmap_format_4" and code > 0xFFFF:
                     continue
                 sub = ET.SubElement(elem, "map")
-                sub.set("code", line.split(",")[0])
-                sub.set("name", line.split(",")[1])
-    for elem in xml.iter("cmap_format_12"):
-        with open("add_cmap.csv", "r") as f:
-            for line in f:
-                # "#" で始まる行はコメント扱い
-                if line.startswith("#"):
-                    continue
-                sub = ET.SubElement(elem, "map")
-                sub.set("code", line.split(",")[0])
-                sub.set("name", line.split(",")[1])
+                sub.set("code", hex(code))
+                sub.set("name", name)
+
+
+@profile
+def fix_cmap_table_ttfont(font):
+    """cmap テーブルを直接編集する"""
+    add_cmap = load_add_cmap()
+
+    # 存在しないグリフを参照するとテーブルを書き出せないため、除外して警告する
+    # --profile で絞り込んだビルドでは多数になるため、件数と先頭のいくつかのみを出力する
+    glyph_names = font.getReverseGlyphMap()
+    missing = {code: name for code, name in add_cmap.items() if name not in glyph_names}
+    if missing:
+        samples = ", ".join(
+            f"U+{code:04X} {name}" for code, name in list(missing.items())[:5]
+        )
+        print(
+            f"Warning: {ADD_CMAP_CSV}: {len(missing)} glyphs not found"
+            f" ({samples}{', ...' if len(missing) > 5 else ''})"
+        )
+    add_cmap_full = {c: n for c, n in add_cmap.items() if c not in missing}
+    add_cmap_bmp = {c: n for c, n in add_cmap_full.items() if c <= 0xFFFF}
+
+    # Unicode のサブテーブル全てに追加する
+    for table in font["cmap"].tables:
+        if not table.isUnicode():
+            continue
+        if table.format == 4:
+            table.cmap.update(add_cmap_bmp)
+        elif table.format == 12:
+            table.cmap.update(add_cmap_full)
+
+
+@profile
+def remove_hinting_ttfont(font):
+    """ヒント情報を削除する (ttfautohint --dehint 相当)"""
+    for tag in HINTING_TABLES:
+        if tag in font:
+            del font[tag]
+    # 展開せずに各グリフのデータから命令を取り除く
+    glyf = font["glyf"]
+    for glyph in glyf.glyphs.values():
+        glyph.removeHinting()
+    maxp = font["maxp"]
+    if maxp.tableVersion >= 0x00010000:
+        maxp.maxZones = 1
+        maxp.maxTwilightPoints = 0
+        maxp.maxStorage = 0
+        maxp.maxFunctionDefs = 0
+        maxp.maxInstructionDefs = 0
+        maxp.maxStackElements = 0
+        maxp.maxSizeOfInstructions = 0
+
+
+@profile
+def dedup_outlines_ttfont(font) -> int:
+    """同じ輪郭のグリフを、最初に現れたグリフを参照する1コンポーネントの複合グリフに置き換える
+
+    copy_altuni() で複製したグリフや、別のコードポイントに重複して含まれる Nerd Fonts の
+    アイコン等が対象になる。削減したバイト数を返す
+    """
+    glyf = font["glyf"]
+    metrics = font["hmtx"].metrics
+    base_names = {}
+    positions = {}
+    saved = 0
+    count = 0
+    for name in font.getGlyphOrder():
+        outline = get_normalized_outline(glyf, name)
+        if outline is None:
+            continue
+        key, positions[name] = outline
+        # hmtx の lsb が輪郭と一致しないグリフは、参照にすると描画位置が変わり得るため除く
+        if metrics[name][1] != positions[name][0]:
+            continue
+        base_name = base_names.setdefault(key, name)
+        if base_name == name:
+            continue
+
+        component = GlyphComponent()
+        component.glyphName = base_name
+        component.x = positions[name][0] - positions[base_name][0]
+        component.y = positions[name][1] - positions[base_name][1]
+        component.flags = ROUND_XY_TO_GRID
+        # 水平位置と幅が同じ場合は参照先のメトリクスを使う
+        if component.x == 0 and metrics[name][0] == metrics[base_name][0]:
+            component.flags |= USE_MY_METRICS
+        composite = Glyph()
+        composite.numberOfContours = -1
+        composite.components = [component]
+        composite.recalcBounds(glyf)
+
+        size = len(glyf.glyphs[name].compile(glyf))
+        glyf.glyphs[name] = composite
+        saved += size - len(composite.compile(glyf))
+        count += 1
+    print(f"Deduplicated outlines: {count} glyphs, {saved} bytes saved")
+    return saved
+
+
+def get_normalized_outline(glyf, name: str):
+    """輪郭を左下が原点になるよう平行移動したもののハッシュと、元の左下の座標を返す
+
+    輪郭を持たないグリフ、複合グリフの場合は None を返す
+    """
+    glyph = glyf.glyphs[name]
+    if hasattr(glyph, "data"):
+        # 保存時に再コンパイルしないよう、元のグリフは展開せずにコピーを展開する
+        glyph = Glyph(glyph.data)
+        glyph.expand(glyf)
+    if glyph.numberOfContours <= 0:
+        return None
+    coordinates = glyph.coordinates.copy()
+    x_min = min(x for x, _ in coordinates)
+    y_min = min(y for _, y in coordinates)
+    coordinates.translate((-x_min, -y_min))
+    # 輪郭の終点、on-curve フラグ、平行移動後の座標のハッシュで比較する
+    key = hashlib.sha1(array("H", glyph.endPtsOfContours).tobytes())
+    key.update(bytes(flag & 0x01 for flag in glyph.flags))
+    key.update(coordinates.array.tobytes())
+    return key.digest(), (x_min, y_min)
+
+
+def restamp_font(path: str):
+    """ビルド済みのフォントのメタデータを build.ini の値で書き換える
+
+    fontforge_script.py の edit_meta_data() と本スクリプトでの OS/2, post テーブルの編集と
+    同じ値を設定するため、FontForge を使わずにバージョン等の変更を反映できる
+    """
+    # ファイル名から variant, style を取得
+    parsed = parse_font_path(path)
+    if parsed is None:
+        print(f"Error: {path} is not a {FONT_NAME} font")
+        return
+    variant, style = parsed
+
+    print(f"Restamp {path}")
+    font = TTFont(path)
+    fix_name_table_ttfont(font["name"], style, variant)
+    fix_metrics_ttfont(font)
+    fix_os2_table_ttfont(font["OS/2"], style, flag_hw=HALF_WIDTH_STR in variant)
+    fix_post_table_ttfont(font["post"])
+    font.save(path)
+    font.close()
+
+
+def parse_font_path(path: str):
+    """ビルド済みのフォントのファイル名から variant, style を返す (該当しない場合は None)"""
+    matched = re.fullmatch(
+        rf"{re.escape(FONT_NAME)}(.*)-([^-]+)\.ttf", os.path.basename(path)
+    )
+    if matched is None:
+        return None
+    return matched.groups()
+
+
+def generate_web_fonts(paths: list, pool=None):
+    """ビルド済みのフォントから Web フォントと CSS を生成する
+
+    pool を渡した場合はフォント毎に並列で生成する
+    """
+    font_paths = []
+    for path in paths:
+        if parse_font_path(path) is None:
+            print(f"Error: {path} is not a {FONT_NAME} font")
+            continue
+        font_paths.append(path)
+    if pool is None:
+        results = [generate_web_font(path) for path in font_paths]
+    else:
+        results = pool.map(generate_web_font, font_paths, chunksize=1)
+    write_web_css(list(zip(font_paths, results)))
+
+
+def get_web_subsets(cmap) -> list:
+    """cmap のコードポイントをサブセットに振り分け、(サブセット名, コードポイント) のリストを返す
+
+    コードポイントは先に定義したサブセットに含める。
+    該当する文字のないサブセット (Nerd Fonts 非対応版の nerd 等) は含めない
+    """
+    remaining = set(cmap)
+    subsets = []
+    for name in WEB_SUBSETS:
+        if name == "rest":
+            codepoints = set(remaining)
+        else:
+            codepoints = remaining & get_web_subset_codepoints(name)
+        remaining -= codepoints
+        if codepoints:
+            subsets.append((name, frozenset(codepoints)))
+    return subsets
+
+
+def load_web_subsets(path: str) -> list:
+    """ビルド済みのフォントの cmap のみを読み込み、Web フォントのサブセットを返す"""
+    font = TTFont(path, lazy=True)
+    subsets = get_web_subsets(font.getBestCmap())
+    font.close()
+    return subsets
+
+
+@functools.lru_cache(maxsize=None)
+def get_web_subset_codepoints(name: str) -> frozenset:
+    """Web フォントのサブセットに含めるコードポイントを返す"""
+    if name == "latin":
+        ranges = [
+            (0x0000, 0x024F),  # ASCII, Latin-1, ラテン文字拡張
+            (0x02B0, 0x036F),  # 前進を伴う修飾文字, ダイアクリティカルマーク
+            (0x2000, 0x206F),  # 一般句読点
+            (0x20A0, 0x20CF),  # 通貨記号
+            (0x2100, 0x214F),  # 文字様記号
+        ]
+        return frozenset(c for start, end in ranges for c in range(start, end + 1))
+    if name == "kana":
+        ranges = [
+            (0x3000, 0x30FF),  # CJK の記号及び句読点, 平仮名, 片仮名
+            (0x31F0, 0x31FF),  # 片仮名拡張
+            (0xFF00, 0xFFEF),  # 半角・全角形
+        ]
+        codepoints = {c for start, end in ranges for c in range(start, end + 1)}
+        # JIS X 0208 の非漢字 (1〜8区) の記号類もまとめる
+        jis_symbols = coverage_profiles.JIS_ROWS["jis-symbols"]
+        codepoints |= coverage_profiles.get_jis_codepoints(*jis_symbols)
+        return frozenset(codepoints)
+    if name in ("jis1", "jis2"):
+        # JIS 第1水準漢字 (16〜47区)、第2水準漢字 (48〜84区)
+        return coverage_profiles.get_jis_codepoints(*coverage_profiles.JIS_ROWS[name])
+    if name == "nerd":
+        # Nerd Fonts のアイコン (私用領域)
+        ranges = [(0xE000, 0xF8FF), (0xF0000, 0x10FFFF)]
+        return frozenset(c for start, end in ranges for c in range(start, end + 1))
+    raise ValueError(f"unknown web subset: {name}")
+
+
+def generate_web_font(path: str) -> list:
+    """1フォント分の WOFF2 (サブセット化しないもの、サブセット毎のもの) を生成する
+
+    生成したサブセットの (サブセット名, コードポイント) のリストを返す
+    """
+    # フォントファイルは1回だけ読み込み、サブセット毎にメモリ上のデータから開き直す
+    # 必要なテーブル・グリフのみが読み込まれるため、読み込み済みの TTFont を複製するより速い
+    with open(path, "rb") as f:
+        data = f.read()
+    font = TTFont(io.BytesIO(data))
+    subsets = get_web_subsets(font.getBestCmap())
+    os.makedirs(os.path.dirname(get_web_font_path(path, None)), exist_ok=True)
+    save_web_font(font, get_web_font_path(path, None))
+    for name, codepoints in subsets:
+        font = TTFont(io.BytesIO(data))
+        subset_options = subset.Options()
+        subset_options.layout_features = ["*"]
+        subset_options.name_IDs = ["*"]
+        subset_options.name_languages = ["*"]
+        subset_options.notdef_outline = True
+        subset_options.recalc_bounds = True
+        subsetter = subset.Subsetter(subset_options)
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(font)
+        save_web_font(font, get_web_font_path(path, name))
+    return subsets
+
+
+def save_web_font(font, output_path: str):
+    """WOFF2 として保存する"""
+    print(f"Generate {output_path}")
+    font.flavor = "woff2"
+    font.save(output_path)
+    font.close()
+
+
+def get_web_font_paths(path: str, subsets: list) -> list:
+    """1フォント分の WOFF2 の出力先を全て返す"""
+    return [get_web_font_path(path, None)] + [
+        get_web_font_path(path, name) for name, _ in subsets
+    ]
+
+
+def get_web_font_path(path: str, name) -> str:
+    """フォントのパスとサブセット名から WOFF2 の出力先を返す"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    suffix = "" if name is None else f".{name}"
+    return f"{os.path.dirname(path) or '.'}/{WEB_FONTS_DIR}/{stem}{suffix}.woff2"
+
+
+def write_web_css(fonts: list):
+    """サブセット毎の @font-face を記述した CSS をバリエーション毎に出力する
+
+    fonts には (フォントのパス, get_web_subsets() の結果) のリストを渡す
+    """
+    css = {}
+    for path, subsets in fonts:
+        variant, style = parse_font_path(path)
+        family_name = f"{FONT_NAME} {variant}".strip()
+        css_path = (
+            f"{os.path.dirname(path) or '.'}/{WEB_FONTS_DIR}/{FONT_NAME}{variant}.css"
+        )
+        css.setdefault(css_path, []).extend(
+            get_font_face(path, style, family_name, name, codepoints)
+            for name, codepoints in subsets
+        )
+    for css_path, rules in css.items():
+        print(f"Generate {css_path}")
+        with open(css_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(rules))
+
+
+def get_font_face(path: str, style: str, family_name: str, name: str, codepoints):
+    """1サブセット分の @font-face を返す"""
+    return (
+        "@font-face {\n"
+        f'  font-family: "{family_name}";\n'
+        f"  font-style: {'italic' if style.endswith('Italic') else 'normal'};\n"
+        f"  font-weight: {700 if style.startswith('Bold') else 400};\n"
+        "  font-display: swap;\n"
+        f'  src: url("{os.path.basename(get_web_font_path(path, name))}")'
+        ' format("woff2");\n'
+        f"  unicode-range: {format_unicode_range(codepoints)};\n"
+        "}\n"
+    )
+
+
+def format_unicode_range(codepoints) -> str:
+    """コードポイントの集合を CSS の unicode-range の形式にする"""
+    ranges = []
+    for codepoint in sorted(codepoints):
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    return ", ".join(
+        f"U+{start:X}" if start == end else f"U+{start:X}-{end:X}"
+        for start, end in ranges
+    )
+
+
+def fix_name_table_ttfont(name, style: str, variant: str):
+    """name テーブルを fontforge_script.py の edit_meta_data() と同じ内容にする"""
+    family_name = f"{FONT_NAME} {variant}".strip()
+    full_name = f"{family_name} {style}"
+    names = {
+        0: COPYRIGHT,
+        1: family_name,
+        3: get_unique_id(full_name),
+        4: full_name,
+        5: VERSION,
+        6: f"{FONT_NAME}{variant}-{style}",
+        13: LICENSE,
+        14: LICENSE_URL,
+    }
+    for record in name.names:
+        if record.nameID in names:
+            record.string = names[record.nameID]
+    # 存在しないレコードは Windows 向けに追加する
+    for name_id, value in names.items():
+        if name.getName(name_id, 3, 1, 0x409) is None:
+            name.setName(value, name_id, 3, 1, 0x409)
+
+
+def get_unique_id(full_name: str) -> str:
+    """FontForge が生成時に出力する Unique ID (nameID 3) と同じ形式の文字列を返す
+
+    FontForge と同じく生成した日付を含むため、同じ日に実行した場合のみ一致する。
+    SOURCE_DATE_EPOCH が設定されている場合はその日付を使う
+    """
+    source_date_epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if source_date_epoch:
+        date = time.gmtime(int(source_date_epoch))
+    else:
+        date = time.localtime()
+    return (
+        f"FontForge 2.0 : {full_name} : "
+        f"{date.tm_mday}-{date.tm_mon}-{date.tm_year}"
+    )
+
+
+def fix_metrics_ttfont(font):
+    """OS/2, hhea のメトリクス等を fontforge_script.py の edit_meta_data() と同じ値にする"""
+    os2 = font["OS/2"]
+    os2.sTypoAscender = OS2_ASCENT
+    os2.sTypoDescender = -OS2_DESCENT
+    os2.sTypoLineGap = 0
+    os2.usWinAscent = OS2_ASCENT
+    os2.usWinDescent = OS2_DESCENT
+    os2.achVendID = VENDER_NAME.ljust(4)[:4]
+    os2.ulCodePageRange1, os2.ulCodePageRange2 = OS2_CODEPAGES
+
+    # x-height, cap-height は "x", "H" のグリフの高さから求める
+    cmap = font.getBestCmap()
+    glyf = font["glyf"]
+    os2.sxHeight = round_half_up(glyf[cmap[0x0078]].yMax)
+    os2.sCapHeight = round_half_up(glyf[cmap[0x0048]].yMax)
+
+    hhea = font["hhea"]
+    hhea.ascent = OS2_ASCENT
+    hhea.descent = -OS2_DESCENT
+    hhea.lineGap = 0
+
+
+def round_half_up(value) -> int:
+    """四捨五入した整数を返す"""
+    return int(Decimal(str(value)).quantize(Decimal("0"), ROUND_HALF_UP))
+
+
+@functools.lru_cache(maxsize=None)
+def load_add_cmap(path: str = ADD_CMAP_CSV) -> MappingProxyType:
+    """add_cmap.csv を読み込み、コードポイントからグリフ名への対応表を返す
+
+    add_cmap.csv の内容は以下の形式で、"#" で始まる行はコメント扱い
+    code,name,description
+    """
+    add_cmap = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            fields = line.split(",")
+            try:
+                code = int(fields[0], 16)
+            except ValueError:
+                raise ValueError(f"{path}:{line_no}: invalid code: {line}")
+            if len(fields) < 2 or fields[1] == "":
+                raise ValueError(f"{path}:{line_no}: glyph name is missing: {line}")
+            if code in add_cmap:
+                raise ValueError(f"{path}:{line_no}: duplicate code: {fields[0]}")
+            add_cmap[code] = fields[1]
+    return MappingProxyType(add_cmap)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+#!/bin/env python3
+
+# ビルドの各処理 (ステージ) の処理時間、メモリ使用量、グリフ数を計測する
+# fontforge_script.py, fonttools_script.py から使用する
+
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows では resource モジュールが使えないため、メモリ使用量は記録しない
+    resource = None
+
+enabled = False
+records = []
+depth = 0
+
+
+def start(enable: bool):
+    """計測結果をリセットし、計測を開始する"""
+    global enabled, records, depth
+    enabled = enable
+    records = []
+    depth = 0
+
+
+@contextlib.contextmanager
+def stage(name: str, *fonts):
+    """with 文で囲んだ処理を1つのステージとして計測する
+
+    fonts に渡したフォントのグリフ数を処理後に記録する
+    """
+    global depth
+    if not enabled:
+        yield
+        return
+
+    record = {"stage": name, "depth": depth}
+    records.append(record)
+    depth += 1
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record["seconds"] = round(time.perf_counter() - start_time, 3)
+        depth -= 1
+        record["peak_rss_mb"] = get_peak_rss_mb()
+        record["glyphs"] = [count_glyphs(font) for font in fonts]
+
+
+def profile(func):
+    """関数を1つのステージとして計測するデコレータ
+
+    引数に渡されたフォントのグリフ数を処理後に記録する
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+        fonts = [arg for arg in args if is_font(arg)]
+        with stage(func.__name__, *fonts):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def is_font(obj) -> bool:
+    """FontForge のフォント、fontTools の TTFont のいずれかであれば True を返す"""
+    return hasattr(obj, "getBestCmap") or (
+        hasattr(obj, "glyphs") and hasattr(obj, "mergeFonts")
+    )
+
+
+def count_glyphs(font):
+    """フォントのグリフ数を返す (閉じられたフォントなど数えられない場合は None)"""
+    try:
+        if hasattr(font, "getBestCmap"):
+            return len(font.getGlyphOrder())
+        return sum(1 for glyph in font.glyphs() if glyph.isWorthOutputting())
+    except Exception:
+        return None
+
+
+def get_peak_rss_mb():
+    """プロセスの最大常駐メモリ (MB) を返す"""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト単位、Linux はキロバイト単位
+    if sys.platform == "darwin":
+        return round(peak_rss / 1024 / 1024, 1)
+    return round(peak_rss / 1024, 1)
+
+
+def write_report(path: str, label: str):
+    """計測結果を JSON で保存し、集計表を出力する"""
+    if not enabled:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"label": label, "stages": records}, f, indent=2)
+    print_summary([{"label": label, "stages": records}])
+
+
+def load_reports(report_dir: str) -> list:
+    """report_dir 内の計測結果を読み込む"""
+    reports = []
+    if not os.path.isdir(report_dir):
+        return reports
+    for filename in sorted(os.listdir(report_dir)):
+        if filename.endswith(".json"):
+            with open(os.path.join(report_dir, filename), encoding="utf-8") as f:
+                reports.append(json.load(f))
+    return reports
+
+
+def print_summary(reports: list):
+    """計測結果の集計表を出力する"""
+    for report in reports:
+        print(f"=== Stage report: {report['label']} ===")
+        print(f"{'stage':<40} {'seconds':>9} {'peak MB':>9}  glyphs")
+        for record in report["stages"]:
+            name = "  " * record["depth"] + record["stage"]
+            peak_rss = record["peak_rss_mb"]
+            glyphs = ", ".join(str(g) for g in record["glyphs"])
+            print(
+                f"{name:<40} {record['seconds']:>9.3f} "
+                f"{'-' if peak_rss is None else peak_rss:>9}  {glyphs}"
+            )
+
+
+def print_totals(reports: list):
+    """全ての計測結果について、ステージ毎の処理時間の合計を出力する"""
+    totals = {}
+    for report in reports:
+        for record in report["stages"]:
+            # 入れ子になったステージは親の処理時間に含まれるため、最上位のみ集計する
+            if record["depth"] == 0:
+                totals[record["stage"]] = (
+                    totals.get(record["stage"], 0) + record["seconds"]
+                )
+    print(f"=== Stage totals ({len(reports)} reports) ===")
+    print(f"{'stage':<40} {'seconds':>9}")
+    for name, seconds in sorted(totals.items(), key=lambda x: -x[1]):
+        print(f"{name:<40} {seconds:>9.3f}")
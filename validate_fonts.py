@@ -0,0 +1,336 @@
+#!/bin/env python3
+
+# ビルド済みのフォントの幅、メトリクス、cmap のカバレッジを検証し、結果を JSON で出力する
+# リポジトリのルートで実行すること
+
+import configparser
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import traceback
+
+import numpy as np
+from fontTools.ttLib import TTFont
+
+import coverage_profiles
+import fonttools_script
+
+# iniファイルを読み込む
+settings = configparser.ConfigParser()
+settings.read("build.ini", encoding="utf-8")
+
+FONT_NAME = settings.get("DEFAULT", "FONT_NAME")
+BUILD_FONTS_DIR = settings.get("DEFAULT", "BUILD_FONTS_DIR")
+VENDER_NAME = settings.get("DEFAULT", "VENDER_NAME")
+HALF_WIDTH_STR = settings.get("DEFAULT", "HALF_WIDTH_STR")
+EM_ASCENT = int(settings.get("DEFAULT", "EM_ASCENT"))
+EM_DESCENT = int(settings.get("DEFAULT", "EM_DESCENT"))
+OS2_ASCENT = int(settings.get("DEFAULT", "OS2_ASCENT"))
+OS2_DESCENT = int(settings.get("DEFAULT", "OS2_DESCENT"))
+HALF_WIDTH_12 = int(settings.get("DEFAULT", "HALF_WIDTH_12"))
+FULL_WIDTH_35 = int(settings.get("DEFAULT", "FULL_WIDTH_35"))
+
+# 検証結果の出力先
+REPORT = f"{BUILD_FONTS_DIR}/validation_report.json"
+# エラー毎に出力するグリフ名・コードポイントの最大数
+MAX_DETAILS = 20
+
+options = {}
+
+
+def main():
+    # オプション判定
+    get_options()
+    if options.get("unknown-option"):
+        usage()
+        return
+
+    paths = options.get("files") or fonttools_script.get_built_font_paths()
+    if len(paths) == 0:
+        print(f"Error: {FONT_NAME}*.ttf not found")
+        sys.exit(1)
+
+    jobs = get_validate_jobs(paths, options.get("baseline"), options.get("profile"))
+    with multiprocessing.Pool(processes=options.get("jobs")) as pool:
+        results = pool.map(run_validate_job, jobs, chunksize=1)
+
+    if write_report(options.get("report", REPORT), results) > 0:
+        sys.exit(1)
+
+
+def usage():
+    print(
+        f"Usage: {sys.argv[0]} [--baseline DIR] [--report PATH] [--jobs N]"
+        f" [--profile {'|'.join(coverage_profiles.get_profile_names())}]"
+        f" [{FONT_NAME}*.ttf ...]"
+    )
+
+
+def get_options():
+    """オプションを取得する"""
+
+    global options
+
+    args = iter(sys.argv[1:])
+    for arg in args:
+        # オプション判定
+        if arg == "--baseline":
+            # 前回のリリースのフォントのディレクトリ (cmap のカバレッジの比較に使う)
+            options["baseline"] = next(args, "")
+            if not os.path.isdir(options["baseline"]):
+                options["unknown-option"] = True
+                return
+        elif arg == "--report":
+            # 検証結果の JSON の出力先
+            options["report"] = next(args, "")
+            if options["report"] == "":
+                options["unknown-option"] = True
+                return
+        elif arg == "--jobs":
+            # ワーカープロセス数 (既定値は CPU コア数)
+            jobs = next(args, "")
+            if not jobs.isdecimal() or int(jobs) < 1:
+                options["unknown-option"] = True
+                return
+            options["jobs"] = int(jobs)
+        elif arg == "--profile":
+            # --profile で絞り込んでビルドしたフォントを検証する
+            options["profile"] = next(args, "")
+            if options["profile"] not in coverage_profiles.get_profile_names():
+                options["unknown-option"] = True
+                return
+        elif not arg.startswith("-"):
+            # 検証するファイル (省略時はビルド済みの全てのフォント)
+            options.setdefault("files", []).append(arg)
+        else:
+            options["unknown-option"] = True
+            return
+
+
+def get_validate_jobs(
+    paths: list, baseline_dir: str = None, profile: str = None
+) -> list:
+    """検証の単位 (フォントのパス, 比較するフォントのパス, プロファイル名) のリストを返す
+
+    baseline_dir を指定した場合は、同じファイル名のフォントを baseline_dir 以下から探す
+    """
+    jobs = []
+    for path in paths:
+        baseline_path = None
+        if baseline_dir is not None:
+            matches = sorted(
+                glob.glob(
+                    f"{glob.escape(baseline_dir)}/**/{os.path.basename(path)}",
+                    recursive=True,
+                )
+            )
+            # 見つからない場合は検証時にエラーとする
+            baseline_path = matches[0] if matches else ""
+        jobs.append((path, baseline_path, profile))
+    return jobs
+
+
+def run_validate_job(job) -> dict:
+    """1フォント分の検証を行い、結果を返す"""
+    path, baseline_path, profile = job
+    try:
+        return validate_font(path, baseline_path, profile)
+    except Exception:
+        return {
+            "path": path,
+            "errors": [get_error("exception", traceback.format_exc())],
+        }
+
+
+def validate_font(path: str, baseline_path: str = None, profile: str = None) -> dict:
+    """フォントの幅、メトリクス、cmap を検証する
+
+    baseline_path を指定した場合は、その cmap のコードポイントを全て含むことを確認する
+    profile を指定した場合は、そのプロファイルに含まれるコードポイントのみを対象とする
+    """
+    parsed = fonttools_script.parse_font_path(path)
+    if parsed is None:
+        return {
+            "path": path,
+            "errors": [get_error("filename", f"{path} is not a {FONT_NAME} font")],
+        }
+    variant, style = parsed
+    flag_hw = HALF_WIDTH_STR in variant
+
+    font = TTFont(path)
+    cmap = font.getBestCmap()
+    widths, errors = check_widths(font, flag_hw)
+    errors += check_metrics(font, style, flag_hw)
+    profile_codepoints = coverage_profiles.load_profile(
+        profile or coverage_profiles.FULL_PROFILE
+    )
+    errors += check_add_cmap(font, cmap, profile_codepoints)
+    if baseline_path == "":
+        errors.append(get_error("coverage", "baseline font not found"))
+    elif baseline_path is not None:
+        errors += check_coverage(cmap, baseline_path)
+    result = {
+        "path": path,
+        "variant": variant,
+        "style": style,
+        "glyphs": len(font.getGlyphOrder()),
+        "codepoints": len(cmap),
+        "widths": widths,
+        "errors": errors,
+    }
+    font.close()
+    return result
+
+
+def check_widths(font, flag_hw: bool):
+    """全てのグリフの幅がバリエーションの幅 (0, 半角, 全角) のいずれかであることを確認する
+
+    幅毎のグリフ数とエラーのリストを返す
+    """
+    glyph_order = font.getGlyphOrder()
+    metrics = font["hmtx"].metrics
+    advances = np.fromiter(
+        (metrics[name][0] for name in glyph_order),
+        dtype=np.int32,
+        count=len(glyph_order),
+    )
+    values, counts = np.unique(advances, return_counts=True)
+    widths = {str(value): int(count) for value, count in zip(values, counts)}
+
+    expected = get_expected_widths(flag_hw)
+    invalid = np.flatnonzero(~np.isin(advances, expected))
+    if len(invalid) == 0:
+        return widths, []
+    return widths, [
+        get_error(
+            "widths",
+            f"{len(invalid)} glyphs are not {'/'.join(map(str, expected))} units wide",
+            [f"{glyph_order[i]}: {advances[i]}" for i in invalid[:MAX_DETAILS]],
+        )
+    ]
+
+
+def get_expected_widths(flag_hw: bool) -> tuple:
+    """バリエーションで許容するグリフの幅を返す"""
+    if flag_hw:
+        # 半角1:全角2
+        return (0, HALF_WIDTH_12, HALF_WIDTH_12 * 2)
+    # 半角3:全角5
+    return (0, FULL_WIDTH_35 * 3 // 5, FULL_WIDTH_35)
+
+
+def check_metrics(font, style: str, flag_hw: bool) -> list:
+    """OS/2, hhea 等のメトリクスが build.ini 等から求めた値と一致することを確認する"""
+    x_avg_char_width, fs_selection, panose = fonttools_script.get_os2_values(
+        style, flag_hw
+    )
+    expected = {
+        ("head", "unitsPerEm"): EM_ASCENT + EM_DESCENT,
+        ("OS/2", "sTypoAscender"): OS2_ASCENT,
+        ("OS/2", "sTypoDescender"): -OS2_DESCENT,
+        ("OS/2", "sTypoLineGap"): 0,
+        ("OS/2", "usWinAscent"): OS2_ASCENT,
+        ("OS/2", "usWinDescent"): OS2_DESCENT,
+        ("OS/2", "xAvgCharWidth"): x_avg_char_width,
+        ("OS/2", "fsSelection"): int(fs_selection.replace(" ", ""), 2),
+        ("OS/2", "achVendID"): VENDER_NAME.ljust(4)[:4],
+        ("hhea", "ascent"): OS2_ASCENT,
+        ("hhea", "descent"): -OS2_DESCENT,
+        ("hhea", "lineGap"): 0,
+    }
+    actual = {key: getattr(font[key[0]], key[1]) for key in expected}
+    for key, value in panose.items():
+        expected[("OS/2", f"panose.{key}")] = value
+        actual[("OS/2", f"panose.{key}")] = getattr(font["OS/2"].panose, key)
+
+    mismatches = [
+        f"{table}.{name}: {actual[(table, name)]} (expected {value})"
+        for (table, name), value in expected.items()
+        if actual[(table, name)] != value
+    ]
+    if len(mismatches) == 0:
+        return []
+    return [get_error("metrics", f"{len(mismatches)} values differ", mismatches)]
+
+
+def check_add_cmap(font, cmap: dict, profile_codepoints=None) -> list:
+    """add_cmap.csv の各コードポイントが指定したグリフに割り当てられていることを確認する
+
+    profile_codepoints を指定した場合は、それに含まれないコードポイントは確認しない
+    """
+    glyph_names = font.getReverseGlyphMap()
+    errors = []
+    missing = []
+    unmapped = []
+    for code, name in fonttools_script.load_add_cmap().items():
+        if profile_codepoints is not None and code not in profile_codepoints:
+            continue
+        if name not in glyph_names:
+            missing.append(f"U+{code:04X}: {name}")
+        elif cmap.get(code) != name:
+            unmapped.append(f"U+{code:04X}: {cmap.get(code)} (expected {name})")
+    if missing:
+        errors.append(
+            get_error(
+                "add_cmap",
+                f"{len(missing)} glyphs in {fonttools_script.ADD_CMAP_CSV} not found",
+                missing[:MAX_DETAILS],
+            )
+        )
+    if unmapped:
+        errors.append(
+            get_error(
+                "add_cmap",
+                f"{len(unmapped)} codepoints in {fonttools_script.ADD_CMAP_CSV}"
+                " are not mapped",
+                unmapped[:MAX_DETAILS],
+            )
+        )
+    return errors
+
+
+def check_coverage(cmap: dict, baseline_path: str) -> list:
+    """baseline_path のフォントの cmap のコードポイントを全て含むことを確認する"""
+    baseline_font = TTFont(baseline_path, lazy=True)
+    baseline = np.fromiter(baseline_font.getBestCmap(), dtype=np.int64)
+    baseline_font.close()
+    current = np.fromiter(cmap, dtype=np.int64, count=len(cmap))
+    missing = np.setdiff1d(baseline, current)
+    if len(missing) == 0:
+        return []
+    return [
+        get_error(
+            "coverage",
+            f"{len(missing)} codepoints in {baseline_path} are missing",
+            [f"U+{code:04X}" for code in missing[:MAX_DETAILS]],
+        )
+    ]
+
+
+def get_error(check: str, message: str, details: list = None) -> dict:
+    """検証結果のエラーを返す"""
+    return {"check": check, "message": message, "details": details or []}
+
+
+def write_report(path: str, results: list) -> int:
+    """検証結果を JSON で保存し、概要を出力する。エラーの数を返す"""
+    error_count = sum(len(result["errors"]) for result in results)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"errors": error_count, "fonts": results}, f, indent=2)
+
+    for result in results:
+        status = "NG" if result["errors"] else "OK"
+        print(f"{status} {result['path']}")
+        for error in result["errors"]:
+            print(f"  {error['check']}: {error['message']}")
+            for detail in error["details"]:
+                print(f"    {detail}")
+    print(f"Validation report: {path} ({error_count} errors)")
+    return error_count
+
+
+if __name__ == "__main__":
+    main()